@@ -1,8 +1,8 @@
+import argparse
 import tkinter as tk
 from tkinter import ttk
 import sys
-from tab_client import ClientTab
-from tab_materials import MaterialsTab
+from stall_watchdog import StallWatchdog
 
 class MainApplication:
     def __init__(self, root):
@@ -24,14 +24,54 @@ class MainApplication:
         # Pack the tab control to make it visible
         self.tabControl.pack(expand=1, fill="both")
         
-        # Initialize the content of each tab
-        ClientTab(self.client_tab)
-        MaterialsTab(self.materials_tab)
+        # Tabs are built the first time they are shown, so the window paints
+        # before any tab module is imported; the selected one right after
+        self.tab_builders = {
+            str(self.client_tab): self.build_client_tab,
+            str(self.materials_tab): self.build_materials_tab,
+        }
+        self.tabs = {}
+        self.tabControl.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+        self.root.after_idle(self.on_tab_changed)
+
+        # Stop the tabs' background work before the window goes away
+        self.root.protocol('WM_DELETE_WINDOW', self.close)
+
+    def on_tab_changed(self, event=None):
+        """Build the selected tab if it has not been shown before"""
+        selected = self.tabControl.select()
+        if selected and selected not in self.tabs:
+            self.tabs[selected] = self.tab_builders[selected]()
+
+    def close(self):
+        """Close the tabs that have background work, then the window"""
+        for tab in self.tabs.values():
+            if hasattr(tab, 'close'):
+                tab.close()
+        self.root.destroy()
+
+    def build_client_tab(self):
+        from tab_client import ClientTab
+        return ClientTab(self.client_tab)
+
+    def build_materials_tab(self):
+        from tab_materials import MaterialsTab
+        return MaterialsTab(self.materials_tab)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Engineering Tools")
+    parser.add_argument('--profile', nargs='?', const='profiles', metavar='DIR',
+                        help="profile the UI thread, dumping each stall to DIR (default: profiles)")
+    parser.add_argument('--stall-ms', type=int, default=500,
+                        help="log main loop stalls longer than this (ms)")
+    args = parser.parse_args(argv)
 
-def main():
     root = tk.Tk()
+    # Logs callbacks that freeze the window to stalls.log
+    watchdog = StallWatchdog(root, threshold_ms=args.stall_ms, profile_dir=args.profile)
     app = MainApplication(root)
     root.mainloop()
+    watchdog.stop()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,34 @@
+"""Per-user data directory and the small JSON state files kept in it
+
+Kept apart from client_index so modules that only need a path, such as the
+stall watchdog, do not load sqlite3 and the thread pools at startup.
+"""
+import json
+import os
+
+
+def app_data_dir():
+    """Return the per-user directory for the index and UI state"""
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'ClientFinder')
+
+
+def load_state(path=None):
+    """Load the saved UI state (last directory and such), empty if there is none"""
+    try:
+        with open(path or os.path.join(app_data_dir(), 'state.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state, path=None):
+    """Save the UI state atomically, ignoring a read-only profile"""
+    path = path or os.path.join(app_data_dir(), 'state.json')
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass
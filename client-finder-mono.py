@@ -1,12 +1,26 @@
 import os
-import re
 import sys
 import subprocess
 import tkinter as tk
 from tkinter import messagebox, ttk, simpledialog
-from unidecode import unidecode  # Added import for accent removal
+from app_state import load_state, save_state
+from client_index import (DIRECTORIES, CODE_QUERY_PATTERN, CODED_ROOTS, DRAWING_QUERY_PATTERN,
+                          ClientIndex, ClientRecord, CodeIndex,
+                          DrawingMap, parse_client_folder)
+from client_search import FilterEngine, normalize
+from instrumentation import Recorder
+from scan_worker import Debouncer, Prefetcher, ScanWorker
+from share_fs import CountingFS
+from stall_watchdog import StallWatchdog
+from usage_history import SELECT_SETTLE_MS, UsageHistory
+from virtual_list import VirtualList
 
 class ClientFolderFinder:
+    # Clients listed ahead of time: on each side of the selection, and the
+    # first matches of a search
+    prefetch_neighbours = 2
+    prefetch_matches = 3
+
     def __init__(self, master):
         self.master = master
         master.title("Client Folder Finder")
@@ -25,23 +39,52 @@ class ClientFolderFinder:
         self.dir_label.pack(pady=(10, 0))
 
         # Predefined directories
-        self.directories = {
-            'Desenhos': r'\\192.168.1.252\Desenhos',
-            'Laser': r'\\192.168.1.252\Engenharia 1\Laser\\'
-        }
+        self.directories = dict(DIRECTORIES)
+
+        # Pseudo-directory that searches every predefined directory at once
+        self.all_directories = 'All'
 
         # Directory Combobox
         self.selected_dir = tk.StringVar()
         self.dir_combo = ttk.Combobox(
             self.left_frame, 
             textvariable=self.selected_dir, 
-            values=list(self.directories.keys()),
+            values=list(self.directories.keys()) + [self.all_directories],
             state="readonly",
             width=50
         )
         self.dir_combo.pack(pady=5)
         self.dir_combo.set("Select a directory")
 
+        # Bring the index of the selected directory up to date, listing only
+        # the folders whose mtime changed
+        self.refresh_btn = tk.Button(
+            self.left_frame,
+            text="Refresh",
+            command=self.refresh_client_folders
+        )
+        self.refresh_btn.pack(pady=(0, 5))
+
+        # Local index of clients and drawings, so browsing avoids NAS round trips
+        self.index = ClientIndex(self.directories, fs=CountingFS())
+
+        # Clients this user selects, opens and creates drawings for most, listed
+        # first. A selection counts once it settles, not for each client passed
+        # with the arrow keys.
+        self.usage = UsageHistory()
+        self.select_debouncer = Debouncer(master, SELECT_SETTLE_MS, self.record_selection)
+
+        # Timings of every action, logged as JSONL; F12 shows their histogram
+        self.timings = Recorder(self.index.fs)
+        master.bind('<F12>', self.show_timings)
+
+        # Listings run off the Tk thread so a slow NAS never freezes the window
+        self.worker = ScanWorker(master)
+
+        # Loads the last drawing of likely next clients into the shared drawing
+        # summary cache, so moving with the arrow keys does not wait on the NAS
+        self.prefetcher = Prefetcher(self.find_last_drawing)
+
         # Filter input for clients
         self.filter_label = tk.Label(self.left_frame, text="Search:")
         self.filter_label.pack(pady=(10, 0))
@@ -49,31 +92,21 @@ class ClientFolderFinder:
         self.filter_var = tk.StringVar()
         self.filter_entry = tk.Entry(self.left_frame, textvariable=self.filter_var, width=50)
         self.filter_entry.pack(pady=5)
-        self.filter_var.trace('w', self.update_client_list)
+        # Only the last keystroke of a burst filters and redraws the list
+        self.filter_debouncer = Debouncer(master, 120, self.update_client_list)
+        self.filter_var.trace('w', self.filter_debouncer)
 
         # Client Listbox with Scrollbar
         self.client_label = tk.Label(self.left_frame, text="Clients:")
         self.client_label.pack(pady=(10, 0))
 
-        # Create a frame to hold listbox and scrollbar
+        # Create a frame to hold the client list
         self.client_listbox_frame = tk.Frame(self.left_frame)
         self.client_listbox_frame.pack(pady=5, expand=True, fill=tk.BOTH)
 
-        # Scrollbar
-        self.client_scrollbar = tk.Scrollbar(self.client_listbox_frame)
-        self.client_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-
-        # Listbox with scrollbar
-        self.client_listbox = tk.Listbox(
-            self.client_listbox_frame, 
-            width=70, 
-            height=20, 
-            yscrollcommand=self.client_scrollbar.set
-        )
-        self.client_listbox.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
-
-        # Configure scrollbar
-        self.client_scrollbar.config(command=self.client_listbox.yview)
+        # Virtual list with its own scrollbar; only the visible rows are rendered
+        self.client_listbox = VirtualList(self.client_listbox_frame, width=70, height=20)
+        self.client_listbox.pack(expand=True, fill=tk.BOTH)
 
         # Bind selection event
         self.client_listbox.bind('<<ListboxSelect>>', self.on_client_select)
@@ -115,89 +148,249 @@ class ClientFolderFinder:
 
         # Initialize variables
         self.client_folders = []
+        self.client_records = {}
+        self.client_filter = None
+        self.code_index = None
+        self.drawing_map = DrawingMap([])
         self.filtered_clients = []
         self.current_selected_client = None
         self.current_last_drawing = None
 
+        # Stop the background listings when the window closes, instead of
+        # keeping the process alive until they finish
+        master.protocol('WM_DELETE_WINDOW', self.close)
+
+        # Reopen the last used directory, showing its stored client list at once
+        self.state = load_state()
+        last_dir = self.state.get('ClientFolderFinder.directory')
+        if last_dir in self.directories or last_dir == self.all_directories:
+            self.dir_combo.set(last_dir)
+            self.on_directory_selected(None)
+
     def on_directory_selected(self, event):
         """Clear previous results when a new directory is selected"""
-        self.client_listbox.delete(0, tk.END)
+        self.state['ClientFolderFinder.directory'] = self.selected_dir.get()
+        save_state(self.state)
+        self.worker.cancel('drawings')
+        self.client_listbox.clear()
         self.drawing_listbox.delete(0, tk.END)
         self.open_folder_btn.config(state=tk.DISABLED)
         self.create_drawing_btn.config(state=tk.DISABLED)
+        self.current_selected_client = None
+        self.current_last_drawing = None
+        self.select_debouncer.cancel()
         self.find_client_folders()
 
-    def find_client_folders(self):
+    def refresh_client_folders(self):
+        """Update the index of the selected directory incrementally and reload it"""
+        self.find_client_folders(refresh=True)
+
+    def selected_roots(self):
+        """Return the predefined directories covered by the combobox selection"""
+        selected_key = self.selected_dir.get()
+        if selected_key == self.all_directories:
+            return list(self.directories)
+        if selected_key in self.directories:
+            return [selected_key]
+        return []
+
+    def find_client_folders(self, refresh=False):
         """Find and list folders matching the client folder pattern"""
         # Check if a directory is selected
-        selected_key = self.selected_dir.get()
-        if selected_key not in self.directories:
+        roots = self.selected_roots()
+        if not roots:
             messagebox.showerror("Error", "Please select a directory first")
             return
-
-        # Get the full directory path
-        directory = self.directories[selected_key]
+        self.worker.cancel('revalidate')
+        span = self.timings.start('find_client_folders', directory=self.selected_dir.get(), refresh=refresh)
+
+        # Stale-while-revalidate: a directory listed before is shown straight
+        # from the index and checked against the share in the background
+        snapshot = None if refresh else self.index.snapshot(roots)
+        if snapshot is not None:
+            # A listing of the previous directory must not append to or
+            # replace this one
+            self.worker.cancel('clients')
+            self.worker.cancel('drawing-map')
+            self.load_client_folders(snapshot)
+            self.timings.finish(span, size=len(self.client_folders), source='snapshot')
+            self.worker.submit(
+                'revalidate', self.index.revalidate, roots,
+                on_result=self.apply_revalidated,
+                on_error=lambda e: messagebox.showerror("Error", f"An error occurred: {str(e)}")
+            )
+            return
 
         # Clear previous list
-        self.client_listbox.delete(0, tk.END)
+        self.client_listbox.clear()
+        self.client_folders = []
+        self.client_records = {}
+        self.client_filter = None
+        self.code_index = None
+        self.drawing_map = DrawingMap([])
+        self.filtered_clients = []
 
-        try:
-            # List all folders in the directory
-            folders = [f for f in os.listdir(directory) if os.path.isdir(os.path.join(directory, f))]
-            
-            # Filter and store matching folders based on directory type
-            self.client_folders = []
-            if selected_key == 'Desenhos':
-                # Pattern for Desenhos: xxx - client name or xxx-client name
-                pattern = re.compile(r'^(\d{3})\s*-\s*(.+)$')
-                for folder in folders:
-                    match = pattern.match(folder)
-                    if match:
-                        code, client_name = match.groups()
-                        self.client_folders.append({
-                            'full_name': folder,
-                            'code': code,
-                            'client_name': client_name,
-                            'path': os.path.join(directory, folder)
-                        })
-            else:  # Laser directory
-                # For Laser, use the folder name as client name directly
-                for folder in folders:
-                    self.client_folders.append({
-                        'full_name': folder,
-                        'code': '',  # No code for Laser directory
-                        'client_name': folder,
-                        'path': os.path.join(directory, folder)
-                    })
-            
-            # Initial population of client listbox
+        # Client folders come from the local index; the share is only listed
+        # the first time a directory is used or on refresh. The listing runs in
+        # the background, all directories are listed concurrently, and partial
+        # results of a single directory are shown while they arrive.
+        on_chunk = None
+        if len(roots) == 1:
+            coded = roots[0] in CODED_ROOTS
+            on_chunk = lambda batch: self.add_client_folders([
+                self.make_client_folder(roots[0], name, *parsed)
+                for name, _mtime in batch
+                for parsed in [parse_client_folder(name, coded)] if parsed
+            ])
+
+        def show_error(error):
+            self.timings.finish(span, error=type(error).__name__)
+            messagebox.showerror("Error", f"An error occurred: {str(error)}")
+
+        self.worker.submit(
+            'clients', self.timings.bind(span, self.index.clients_of), roots, refresh,
+            on_result=lambda rows: self.load_client_folders(rows, span),
+            on_chunk=on_chunk,
+            on_error=show_error
+        )
+
+    def make_client_folder(self, root, folder, code, client_name):
+        """Build the client record shown in the listbox"""
+        # The directory path string is shared by every record of the root
+        return ClientRecord(root, self.directories[root], folder, code)
+
+    def client_label(self, folder):
+        """Listbox text of a client, tagged with its directory when searching all of them"""
+        label = folder.full_name
+        if folder.drawing:
+            label = f"{folder.drawing}  ({label})"
+        elif self.code_index is not None and folder in self.code_index.flagged:
+            label = f"{label}  (duplicate code)"
+        if self.selected_dir.get() == self.all_directories:
+            return f"{label}  [{folder.root}]"
+        return label
+
+    def client_folders_of(self, rows):
+        """Client records of index rows, sorted by folder name"""
+        # Desenhos only lists folders matching xxx - client name or xxx-client name,
+        # Laser uses the folder name as client name directly
+        folders = [
+            self.make_client_folder(root, folder, code, client_name)
+            for root, folder, code, client_name in rows
+            if code or root not in CODED_ROOTS
+        ]
+        # Merge the directories into a single list, most used clients first.
+        # The filter keeps this order, so the ranking costs nothing per keystroke.
+        score = self.usage.score
+        folders.sort(key=lambda folder: (-score(folder.root, folder.full_name), folder.full_name, folder.root))
+        return folders
+
+    def load_client_folders(self, rows, span=None):
+        """Store the complete client list of the selected directories and show it"""
+        self.client_folders = self.client_folders_of(rows)
+        self.client_records = {folder.key: folder for folder in self.client_folders}
+        self.client_filter = None
+        # Cheap to build; the initial list already marks duplicate codes
+        self.code_index = None
+        self.client_codes()
+
+        # Initial population of client listbox
+        self.update_client_list()
+        if span is not None:
+            self.timings.finish(span, size=len(self.client_folders), source='share')
+
+        # Build the search engine off the Tk thread; the first keystroke only
+        # builds it itself if it is not ready yet
+        folders = self.client_folders
+        self.worker.submit(
+            'client-filter', lambda token=None: FilterEngine(folders, key=lambda folder: folder.full_name),
+            on_result=lambda engine: self.install_client_filter(folders, engine)
+        )
+
+        # Map every drawing number to its client in the background
+        self.worker.submit(
+            'drawing-map', self.index.drawing_map, self.selected_roots(),
+            on_result=self.load_drawing_map
+        )
+
+    def install_client_filter(self, folders, engine):
+        """Use a search engine built in the background if the list has not changed since"""
+        if folders is self.client_folders and self.client_filter is None:
+            self.client_filter = engine
+
+    def apply_revalidated(self, rows):
+        """Apply a revalidated client list, redrawing only if it changed"""
+        folders = self.client_folders_of(rows)
+        if folders == self.client_folders:
+            return
+        selection = self.client_listbox.curselection()
+        selected = self.filtered_clients[selection[0]] if selection else None
+        self.load_client_folders(rows)
+        if selected in self.filtered_clients:
+            self.client_listbox.select(self.filtered_clients.index(selected))
+
+    def load_drawing_map(self, drawing_map):
+        """Install the drawing number map, refreshing a drawing search in progress"""
+        self.drawing_map = drawing_map
+        if DRAWING_QUERY_PATTERN.match(self.filter_var.get().strip()):
             self.update_client_list()
 
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred: {str(e)}")
+    def find_drawings(self, query):
+        """Return client records for the drawings whose number starts with query"""
+        return [
+            self.client_records[(root, folder)].with_drawing(drawing)
+            for drawing, root, folder in self.drawing_map.lookup(query)
+            if (root, folder) in self.client_records
+        ]
+
+    def add_client_folders(self, folders):
+        """Append a partial batch of client folders while a listing is running"""
+        filter_text = normalize(self.filter_var.get())
+        self.client_folders.extend(folders)
+        matching = [folder for folder in folders if filter_text in normalize(folder.full_name)]
+        self.filtered_clients.extend(matching)
+        self.client_listbox.append_items(self.client_label(folder) for folder in matching)
+        # The filter engine and code index are rebuilt from the longer list on next use
+        self.client_filter = None
+        self.code_index = None
+
+    def client_codes(self):
+        """Return the code index of the client list, building it on first use"""
+        if self.code_index is None:
+            self.code_index = CodeIndex((folder.code, folder) for folder in self.client_folders if folder.code)
+        return self.code_index
 
     def update_client_list(self, *args):
         """Update client listbox based on filter, ignoring accents"""
-        # Normalize the filter text by removing accents and converting to lowercase
-        filter_text = unidecode(self.filter_var.get().lower())
-        
-        # Clear previous list
-        self.client_listbox.delete(0, tk.END)
+        self.filter_debouncer.cancel()
+        span = self.timings.start('update_client_list')
+
+        # The full name contains both the code and the client name, so matching
+        # it covers all three attributes. Normalized keys are cached by the
+        # engine and typing more characters only narrows the previous matches.
+        # When nothing contains the text, the closest names are shown instead.
+        # A full or partial drawing number (110-0110, 110-01) lists the matching
+        # drawings themselves, so selecting one jumps straight to it, and 1 to 3
+        # digits list the clients whose code starts with them.
+        query = self.filter_var.get().strip()
+        code_matches = self.client_codes().prefix(query) if CODE_QUERY_PATTERN.match(query) else None
+        if DRAWING_QUERY_PATTERN.match(query):
+            self.filtered_clients = self.find_drawings(query)
+        elif code_matches:
+            self.filtered_clients = code_matches
+        elif not query and self.client_filter is None:
+            # Everything matches; no need to wait for the engine
+            self.filtered_clients = list(self.client_folders)
+        else:
+            if self.client_filter is None:
+                self.client_filter = FilterEngine(self.client_folders, key=lambda folder: folder.full_name)
+            self.filtered_clients = self.client_filter.ranked_filter(query)
         
-        # Populate listbox with filtered results
-        self.filtered_clients = []
-        for folder in self.client_folders:
-            # Normalize client name attributes for comparison
-            normalized_name = unidecode(folder['client_name'].lower())
-            normalized_code = unidecode(folder['code'].lower())
-            normalized_full_name = unidecode(folder['full_name'].lower())
-            
-            # Check if the normalized filter text matches any of the normalized attributes
-            if (filter_text in normalized_name or 
-                filter_text in normalized_code or 
-                filter_text in normalized_full_name):
-                self.client_listbox.insert(tk.END, folder['full_name'])
-                self.filtered_clients.append(folder)
+        # Replace the listbox contents in bulk; only the visible rows are drawn
+        self.client_listbox.set_items(self.client_label(folder) for folder in self.filtered_clients)
+        self.timings.finish(span, size=len(self.filtered_clients), query_length=len(query))
+        if query:
+            self.prefetcher.prefetch([folder.key for folder in self.filtered_clients[:self.prefetch_matches]])
 
     def on_client_select(self, event):
         """Find and display drawing directories when a client is selected"""
@@ -212,59 +405,102 @@ class ClientFolderFinder:
 
         # Check if a client is selected
         if not self.client_listbox.curselection():
+            self.worker.cancel('drawings')
             return
 
         # Get the selected client
         selected_index = self.client_listbox.curselection()[0]
         self.current_selected_client = self.filtered_clients[selected_index]
+        self.select_debouncer()
+
+        # List the drawings in the background; selecting another client cancels it
+        self.drawing_listbox.insert(tk.END, "Loading...")
+        span = self.timings.start('on_client_select')
+        self.worker.submit(
+            'drawings', self.timings.bind(span, self.find_last_drawing),
+            self.current_selected_client.root, self.current_selected_client.full_name,
+            self.current_selected_client.drawing,
+            on_result=lambda result: self.show_last_drawing(result, span),
+            on_error=lambda e: self.show_drawing_error(e, span)
+        )
+        self.prefetch_neighbours_of(selected_index)
+
+    def record_selection(self):
+        """Count the selected client as used, once the selection has settled"""
+        if self.current_selected_client is not None:
+            self.usage.record(*self.current_selected_client.key, 'select')
+
+    def prefetch_neighbours_of(self, index):
+        """Prefetch the clients around a list position, nearest first"""
+        positions = []
+        for distance in range(1, self.prefetch_neighbours + 1):
+            positions.extend((index + distance, index - distance))
+        self.prefetcher.prefetch([self.filtered_clients[position].key for position in positions
+                                  if 0 <= position < len(self.filtered_clients)])
+
+    def find_last_drawing(self, selected_key, client_folder, drawing=None, token=None):
+        """Return the last (or the given) drawing directory of a client and its Rev-xx folders"""
+        if drawing:
+            last_drawing_dir = drawing
+            rev_folders = self.index.revisions(selected_key, client_folder, drawing, token)
+        else:
+            # Highest numbered drawing directory (xxx-xxxx) and its Rev-xx
+            # subfolders, from the cached drawing summary of the client
+            summary = self.index.drawing_summary(selected_key, client_folder, token)
+            if not summary.last:
+                return None, [], []
+            last_drawing_dir, rev_folders = summary.last, summary.revisions
+
+        # Files of the highest revision, so part files are visible without Explorer
+        files = []
+        if rev_folders:
+            files = self.index.files(selected_key, client_folder, last_drawing_dir, rev_folders[-1], token)
+        return last_drawing_dir, rev_folders, files
+
+    def show_last_drawing(self, result, span=None):
+        """Display the last drawing directory found for the selected client"""
+        last_drawing_dir, rev_folders, files = result
+        self.drawing_listbox.delete(0, tk.END)
+        if span is not None:
+            self.timings.finish(span, size=len(rev_folders) + len(files))
 
-        # Pattern to match drawing directories (xxx-xxxx)
-        drawing_pattern = re.compile(r'^\d{3}-\d{4}$')
-        drawing_dirs = []
+        if last_drawing_dir:
+            last_drawing_path = os.path.join(self.current_selected_client.path, last_drawing_dir)
 
-        try:
-            # List all subdirectories in the client folder
-            for item in os.listdir(self.current_selected_client['path']):
-                item_path = os.path.join(self.current_selected_client['path'], item)
-                if os.path.isdir(item_path) and drawing_pattern.match(item):
-                    drawing_dirs.append(item)
-
-            # Sort drawing directories to find the last one
-            if drawing_dirs:
-                # Improved sorting to handle multi-digit drawing numbers correctly
-                sorted_drawing_dirs = sorted(drawing_dirs, 
-                    key=lambda x: tuple(map(int, x.split('-'))), 
-                    reverse=False
-                )
-                last_drawing_dir = sorted_drawing_dirs[-1]
-                last_drawing_path = os.path.join(self.current_selected_client['path'], last_drawing_dir)
-                
-                # Check for Rev-xx subfolders
-                rev_folders = [f for f in os.listdir(last_drawing_path) 
-                               if os.path.isdir(os.path.join(last_drawing_path, f)) 
-                               and re.match(r'^Rev-\d{2}$', f)]
-                
-                # Store current last drawing info
-                self.current_last_drawing = last_drawing_dir
-
-                # Display the last drawing directory
-                self.drawing_listbox.insert(tk.END, f"Last Drawing Directory: {last_drawing_dir}")
-                self.drawing_listbox.insert(tk.END, f"Full Path: {last_drawing_path}")
-                
-                # Display Rev folders if exist
-                if rev_folders:
-                    self.drawing_listbox.insert(tk.END, "Revision Folders:")
-                    for rev in sorted(rev_folders):
-                        self.drawing_listbox.insert(tk.END, f"- {rev}")
-
-                # Enable buttons
-                self.open_folder_btn.config(state=tk.NORMAL)
-                self.create_drawing_btn.config(state=tk.NORMAL)
-            else:
-                self.drawing_listbox.insert(tk.END, "No drawing directories found.")
+            # Store current last drawing info
+            self.current_last_drawing = last_drawing_dir
 
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred: {str(e)}")
+            # Display the last drawing directory, or the drawing searched by number
+            if self.current_selected_client.drawing:
+                self.drawing_listbox.insert(tk.END, f"Drawing Directory: {last_drawing_dir}")
+            else:
+                self.drawing_listbox.insert(tk.END, f"Last Drawing Directory: {last_drawing_dir}")
+            self.drawing_listbox.insert(tk.END, f"Full Path: {last_drawing_path}")
+            
+            # Display Rev folders if exist
+            if rev_folders:
+                self.drawing_listbox.insert(tk.END, "Revision Folders:")
+                for rev in rev_folders:
+                    self.drawing_listbox.insert(tk.END, f"- {rev}")
+
+            # Display the files of the highest revision
+            if files:
+                self.drawing_listbox.insert(tk.END, f"Files in {rev_folders[-1]}:")
+                for name, _size, _mtime in files:
+                    self.drawing_listbox.insert(tk.END, f"- {name}")
+
+            # Enable buttons
+            self.open_folder_btn.config(state=tk.NORMAL)
+            self.create_drawing_btn.config(state=tk.NORMAL)
+        else:
+            self.drawing_listbox.insert(tk.END, "No drawing directories found.")
+
+    def show_drawing_error(self, error, span=None):
+        """Report a failed drawing listing"""
+        if span is not None:
+            self.timings.finish(span, error=type(error).__name__)
+        self.drawing_listbox.delete(0, tk.END)
+        messagebox.showerror("Error", f"An error occurred: {str(error)}")
 
     def open_last_drawing(self):
         """Open the last drawing folder, prioritizing the highest Rev-xx subfolder"""
@@ -272,22 +508,25 @@ class ClientFolderFinder:
             messagebox.showerror("Error", "No drawing selected")
             return
 
-        full_path = os.path.join(self.current_selected_client['path'], self.current_last_drawing)
+        full_path = os.path.join(self.current_selected_client.path, self.current_last_drawing)
+        span = self.timings.start('open_last_drawing')
+        self.usage.record(*self.current_selected_client.key, 'open')
         
         try:
-            # Check for Rev-xx subfolders
-            rev_folders = [f for f in os.listdir(full_path) 
-                           if os.path.isdir(os.path.join(full_path, f)) 
-                           and re.match(r'^Rev-\d{2}$', f)]
+            # Rev-xx subfolders, sorted numerically; the last drawing's come
+            # from the summary already loaded when the client was selected
+            root = self.current_selected_client.root
+            folder = self.current_selected_client.full_name
+            with self.timings.measuring(span):
+                summary = self.index.drawing_summary(root, folder)
+                if summary.last == self.current_last_drawing:
+                    rev_folders = summary.revisions
+                else:
+                    rev_folders = self.index.revisions(root, folder, self.current_last_drawing)
             
             # If Rev folders exist, find and open the highest numbered one
             if rev_folders:
-                # Sort Rev folders numerically
-                sorted_rev_folders = sorted(rev_folders, 
-                    key=lambda x: int(x.split('-')[1]), 
-                    reverse=True
-                )
-                highest_rev_folder = sorted_rev_folders[0]
+                highest_rev_folder = rev_folders[-1]
                 path_to_open = os.path.join(full_path, highest_rev_folder)
             else:
                 # If no Rev folders, open the main drawing directory
@@ -306,43 +545,31 @@ class ClientFolderFinder:
 
         except Exception as e:
             messagebox.showerror("Error", f"Could not open folder: {str(e)}")
+        finally:
+            self.timings.finish(span)
 
     def create_new_drawing(self):
         """Create a new drawing directory and Rev-00 subfolder"""
         if not self.current_selected_client:
             messagebox.showerror("Error", "No client selected")
             return
+        client = self.current_selected_client
+        span = self.timings.start('create_new_drawing')
+        self.usage.record(*client.key, 'create')
 
         try:
-            # Find the next drawing number
-            drawing_pattern = re.compile(r'^\d{3}-\d{4}$')
-            existing_drawings = [
-                f for f in os.listdir(self.current_selected_client['path']) 
-                if os.path.isdir(os.path.join(self.current_selected_client['path'], f)) 
-                and drawing_pattern.match(f)
-            ]
-
-            # Sort and get the last drawing number
-            if existing_drawings:
-                sorted_drawings = sorted(existing_drawings, 
-                    key=lambda x: tuple(map(int, x.split('-'))), 
-                    reverse=True
+            # Reserve the next drawing number; the folder is created atomically,
+            # so a colleague creating one at the same time gets the next number
+            with self.timings.measuring(span):
+                new_drawing_name = self.index.allocate_drawing(
+                    client.root,
+                    client.full_name,
+                    client.code
                 )
-                last_drawing = sorted_drawings[0]
-                last_number = int(last_drawing.split('-')[1])
-                new_number = last_number + 1
-            else:
-                new_number = 1
-
-            # Create new drawing directory
-            new_drawing_name = f"{self.current_selected_client['code'] or '000'}-{new_number:04d}"
-            new_drawing_path = os.path.join(self.current_selected_client['path'], new_drawing_name)
-            
-            # Create the directory
-            os.makedirs(new_drawing_path, exist_ok=True)
+            new_drawing_path = os.path.join(client.path, new_drawing_name)
 
             # For Desenhos, create Rev-00 subfolder
-            if self.selected_dir.get() == 'Desenhos':
+            if client.root == 'Desenhos':
                 rev_path = os.path.join(new_drawing_path, 'Rev-00')
                 os.makedirs(rev_path, exist_ok=True)
 
@@ -350,7 +577,7 @@ class ClientFolderFinder:
             self.on_client_select(None)
 
             # Open the Rev-00 folder for Desenhos, otherwise open the new drawing directory
-            path_to_open = rev_path if self.selected_dir.get() == 'Desenhos' else new_drawing_path
+            path_to_open = rev_path if client.root == 'Desenhos' else new_drawing_path
             if os.name == 'nt':  # Windows
                 os.startfile(path_to_open)
             elif os.name == 'posix':  # macOS and Linux
@@ -361,11 +588,31 @@ class ClientFolderFinder:
 
         except Exception as e:
             messagebox.showerror("Error", f"Could not create new drawing: {str(e)}")
+        finally:
+            self.timings.finish(span)
+
+    def close(self):
+        """Cancel the scans and prefetches still queued or running and close the window"""
+        self.worker.shutdown()
+        self.prefetcher.shutdown()
+        self.master.destroy()
+
+    def show_timings(self, event=None):
+        """Show the response time histogram of this session"""
+        window = tk.Toplevel(self.master)
+        window.title("Response Times")
+        text = tk.Text(window, width=80, height=30, font='TkFixedFont')
+        text.pack(expand=True, fill=tk.BOTH)
+        text.insert(tk.END, self.timings.report() or "No actions recorded yet.")
+        text.config(state=tk.DISABLED)
 
 def main():
     root = tk.Tk()
+    # Logs callbacks that freeze the window to stalls.log
+    watchdog = StallWatchdog(root)
     app = ClientFolderFinder(root)
     root.mainloop()
+    watchdog.stop()
 
 if __name__ == "__main__":
     main()
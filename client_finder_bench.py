@@ -0,0 +1,315 @@
+"""Benchmarks of the finder's hot paths against a synthetic share tree, printed as JSON
+
+Usage examples:
+    python client_finder_bench.py
+    python client_finder_bench.py --clients 2000 --drawings 50 --revisions 3
+    python client_finder_bench.py --output after.json --compare before.json
+    python client_finder_bench.py --latency 0.004 --jitter 0.002
+    python client_finder_bench.py --startup --budget-ms 1500
+
+The tree mimics the NAS: Desenhos holds "nnn - Client" folders with nnn-xxxx
+drawings and Rev-xx subfolders, Laser holds plain client folders, and client
+names carry accents so normalization is exercised. The actions time the same
+index and search calls the GUI handlers make, headlessly:
+
+    scan_clients       find_client_folders on a directory never listed before
+    load_clients       find_client_folders from the index, plus the search engine
+    filter_keystroke   update_client_list for each keystroke of a typed query
+    drawing_lookup     update_client_list for a drawing number
+    select_client      on_client_select (last drawing, revisions and files)
+    populate_drawings  populate_drawing_listbox (recent drawing folders)
+    create_drawing     create_new_drawing (reserve the number, Rev-00)
+
+With --latency the index goes through share_fs.SlowFS, so every stat,
+directory page and mkdir costs a simulated SMB round trip, and each action
+also reports its round trips per run.
+
+--startup instead launches ClientFinder.py's window in fresh interpreters
+with an empty profile and exits with status 1 when the median cold start
+(process launch to the first painted window) or the import time of
+ClientFinder goes over its budget.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from client_index import ClientIndex, CODED_ROOTS, parse_client_folder, recent_subdirs
+from client_search import FilterEngine
+from share_fs import SlowFS
+
+WORDS = [
+    'Perfisul', 'São João', 'Metalúrgica', 'Indústria', 'Comércio', 'Conceição',
+    'Agrícola', 'Elétrica', 'Ação', 'Máquinas', 'Estruturas', 'Aço', 'Usinagem',
+    'Caldeiraria', 'Irmãos', 'Ferragens', 'Construções', 'Automação', 'Peças', 'Nordeste',
+]
+
+
+def make_share_tree(base, clients=200, drawings=20, revisions=2, files=2, laser_clients=None, seed=0):
+    """Create Desenhos and Laser trees under base and return their directories mapping"""
+    rng = random.Random(seed)
+    desenhos = os.path.join(base, 'Desenhos')
+    laser = os.path.join(base, 'Laser')
+    names = set()
+    while len(names) < clients:
+        names.add(' '.join(rng.sample(WORDS, rng.randint(1, 3))))
+    for number, name in enumerate(sorted(names), 1):
+        code = f"{number % 1000:03d}"
+        client = os.path.join(desenhos, f"{code} - {name}" if rng.random() < 0.5 else f"{code}-{name}")
+        for drawing in range(1, drawings + 1):
+            drawing_path = os.path.join(client, f"{code}-{drawing:04d}")
+            for rev in range(revisions):
+                rev_path = os.path.join(drawing_path, f"Rev-{rev:02d}")
+                os.makedirs(rev_path)
+                for index in range(files):
+                    open(os.path.join(rev_path, f"{code}-{drawing:04d}-{index}.dxf"), 'w').close()
+            if not revisions:
+                os.makedirs(drawing_path)
+        if not drawings:
+            os.makedirs(client)
+    for name in sorted(names)[:clients if laser_clients is None else laser_clients]:
+        os.makedirs(os.path.join(laser, name, 'Chapas'))
+    return {'Desenhos': desenhos, 'Laser': laser}
+
+
+def timed(func, repeat):
+    """Run func repeat times and return the timings in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings):
+    return {
+        'runs': len(timings),
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'max': max(timings),
+    }
+
+
+def run_benchmarks(directories, repeat=5, query='metalurgica', seed=0, fs=None):
+    """Time every action against directories and return {action: summary}
+
+    With a SlowFS as fs, each summary also has the round trips per run.
+    """
+    rng = random.Random(seed)
+    roots = list(directories)
+    results = {}
+
+    def record(action, timings, round_trips_before):
+        results[action] = summarize(timings)
+        if fs is not None:
+            results[action]['round_trips'] = (fs.round_trips() - round_trips_before) / len(timings)
+
+    def scan():
+        index = ClientIndex(directories, ':memory:', fs)
+        index.clients_of(roots)
+        index.close()
+    before = fs.round_trips() if fs else 0
+    record('scan_clients', timed(scan, repeat), before)
+
+    index = ClientIndex(directories, ':memory:', fs)
+    rows = index.clients_of(roots)
+
+    def load():
+        records = sorted((folder, root) for root, folder, _code, _name in index.clients_of(roots))
+        return FilterEngine([(root, folder) for folder, root in records], key=lambda record: record[1])
+    before = fs.round_trips() if fs else 0
+    record('load_clients', timed(load, repeat), before)
+
+    engine = load()
+    keystrokes = [query[:length] for length in range(1, len(query) + 1)]
+    timings = []
+    for _ in range(repeat):
+        # Forget the previous round so narrowing starts from scratch
+        engine.last_query = engine.last_result = None
+        for typed in keystrokes:
+            start = time.perf_counter()
+            engine.ranked_filter(typed)
+            timings.append(time.perf_counter() - start)
+    results['filter_keystroke'] = summarize(timings)
+
+    # Indexes the drawings of every client; not timed
+    drawing_map = index.drawing_map(roots)
+    numbers = drawing_map.numbers or ['000-0001']
+    results['drawing_lookup'] = summarize(timed(lambda: drawing_map.lookup(rng.choice(numbers)[:6]), repeat))
+    results['drawing_lookup']['drawings'] = len(drawing_map)
+
+    coded = [(root, folder) for root, folder, code, _name in rows if code]
+    clients = [rng.choice(coded) for _ in range(repeat)] if coded else []
+
+    def select(client):
+        summary = index.drawing_summary(*client)
+        if summary.revisions:
+            index.files(*client, summary.last, summary.revisions[-1])
+
+    if clients:
+        # First selection of each client lists it, the rest are served from the index
+        before = fs.round_trips() if fs else 0
+        record('select_client', [timed(lambda: select(client), 1)[0] for client in clients], before)
+        # The recency list needs current drawing mtimes, so it lists the
+        # client folder again unless a prefetch just did
+        before = fs.round_trips() if fs else 0
+        record('populate_drawings',
+               [timed(lambda: recent_subdirs(index.subdirs(*client, max_age=0), 10), 1)[0]
+                for client in clients],
+               before)
+
+        def create(client):
+            root, folder = client
+            code, _name = parse_client_folder(folder, root in CODED_ROOTS)
+            name = index.allocate_drawing(root, folder, code)
+            index.fs.mkdir(os.path.join(index.client_path(root, folder), name, 'Rev-00'))
+        before = fs.round_trips() if fs else 0
+        record('create_drawing', [timed(lambda: create(client), 1)[0] for client in clients], before)
+
+    index.close()
+    return results
+
+
+# Runs in a fresh interpreter; prints the in-process timings as JSON
+STARTUP_PROBE = """
+import json, time
+start = time.perf_counter()
+import ClientFinder
+timings = {'import_ms': (time.perf_counter() - start) * 1000}
+import tkinter as tk
+try:
+    root = tk.Tk()
+except tk.TclError as e:
+    timings['error'] = str(e)
+else:
+    app = ClientFinder.MainApplication(root)
+    root.update()
+    timings['window_ms'] = (time.perf_counter() - start) * 1000
+    root.destroy()
+print(json.dumps(timings))
+"""
+
+
+def measure_startup(repeat=5):
+    """Launch the main window repeat times and return the startup summaries"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    with tempfile.TemporaryDirectory(prefix='clientfinder-startup-') as profile:
+        # No saved directory or index, as on a first start
+        env = dict(os.environ, LOCALAPPDATA=profile)
+        env.pop('CLIENTFINDER_INDEX', None)
+        env.pop('CLIENTFINDER_SERVER', None)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', STARTUP_PROBE], cwd=here, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            run = json.loads(output)
+            if 'error' not in run:
+                run['process_ms'] = (time.perf_counter() - start) * 1000
+            runs.append(run)
+    report = {'import_ms': summarize([run['import_ms'] for run in runs])}
+    if all('error' not in run for run in runs):
+        report['window_ms'] = summarize([run['window_ms'] for run in runs])
+        report['process_ms'] = summarize([run['process_ms'] for run in runs])
+    else:
+        report['error'] = runs[0]['error']
+    return report
+
+
+def compare(results, baseline):
+    """Median ratio of each action to a previous report (above 1 is slower)"""
+    ratios = {}
+    for action, summary in results.items():
+        before = baseline.get('results', {}).get(action)
+        if before and before['median'] > 0:
+            ratios[action] = summary['median'] / before['median']
+    return ratios
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the finder against a synthetic share tree")
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--drawings', type=int, default=20, help="drawings per client")
+    parser.add_argument('--revisions', type=int, default=2, help="Rev-xx folders per drawing")
+    parser.add_argument('--files', type=int, default=2, help="files per Rev-xx folder")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--query', default='metalurgica', help="text typed in the search box")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, help="simulated seconds per share round trip")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra random seconds per round trip")
+    parser.add_argument('--tree', help="reuse or keep the tree in this directory")
+    parser.add_argument('--output', help="also write the report to this file")
+    parser.add_argument('--compare', help="previous report to compare medians with")
+    parser.add_argument('--startup', action='store_true', help="measure cold start instead")
+    parser.add_argument('--budget-ms', type=float, default=1500,
+                        help="cold start budget with --startup (median ms)")
+    parser.add_argument('--import-budget-ms', type=float, default=300,
+                        help="import budget of ClientFinder with --startup (median ms)")
+    return parser
+
+
+def check_startup(args):
+    """Print the startup report; status 1 if over budget, 2 if no window could be opened"""
+    report = measure_startup(args.repeat)
+    report['budget_ms'] = args.budget_ms
+    report['import_budget_ms'] = args.import_budget_ms
+    over = report['import_ms']['median'] > args.import_budget_ms
+    if 'process_ms' in report:
+        over = over or report['process_ms']['median'] > args.budget_ms
+    report['ok'] = not over
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write('\n')
+    if over:
+        return 1
+    return 2 if 'error' in report else 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.startup:
+        return check_startup(args)
+    base = args.tree or tempfile.mkdtemp(prefix='clientfinder-bench-')
+    try:
+        directories = {'Desenhos': os.path.join(base, 'Desenhos'), 'Laser': os.path.join(base, 'Laser')}
+        if not os.path.isdir(directories['Desenhos']):
+            directories = make_share_tree(base, args.clients, args.drawings, args.revisions,
+                                          args.files, seed=args.seed)
+        fs = SlowFS(args.latency, args.jitter, seed=args.seed) if args.latency is not None else None
+        report = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'tree': {
+                'clients': args.clients,
+                'drawings': args.drawings,
+                'revisions': args.revisions,
+                'files': args.files,
+            },
+            'latency': args.latency,
+            'jitter': args.jitter,
+            'results': run_benchmarks(directories, args.repeat, args.query, args.seed, fs),
+        }
+        if args.compare:
+            with open(args.compare, encoding='utf-8') as f:
+                report['compare'] = compare(report['results'], json.load(f))
+    finally:
+        if not args.tree:
+            shutil.rmtree(base, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""Headless client/drawing queries against the local index, printed as JSON
+
+Usage examples:
+    python client_finder_cli.py find perfisul
+    python client_finder_cli.py last 110
+    python client_finder_cli.py next 110
+    python client_finder_cli.py drawing 110-0110
+    python client_finder_cli.py build
+    python client_finder_cli.py files --code 110 --ext dxf --days 30
+    python client_finder_cli.py refresh --deep
+
+files only answers from Rev-xx folders that have been indexed, so run build
+once per directory first; refresh keeps the built index current after that.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from client_index import (DIRECTORIES, CODED_ROOTS, ClientIndex, next_drawing_name,
+                          parse_client_folder)
+from client_search import ranked_scan
+
+
+def client_record(index, root, folder):
+    """JSON-ready description of a client folder"""
+    parsed = parse_client_folder(folder, root in CODED_ROOTS)
+    code, client_name = parsed if parsed else ('', folder)
+    return {
+        'root': root,
+        'folder': folder,
+        'code': code,
+        'client_name': client_name,
+        'path': index.client_path(root, folder),
+    }
+
+
+class AmbiguousClient(ValueError):
+    """Raised when a client code is shared by several client folders"""
+
+    def __init__(self, code, clients):
+        folders = ', '.join(client['folder'] for client in clients)
+        super().__init__(f"code {code} is used by several client folders: {folders}")
+        self.clients = clients
+
+
+def find_clients(index, roots, query, limit=20):
+    """Return client records ranked for query, as in the GUI search box
+
+    A run answers a single query, so rather than building a FilterEngine this
+    makes one pass over the normalized names stored in the index.
+    """
+    rows = index.search_keys(roots)
+    return [client_record(index, rows[i][0], rows[i][1])
+            for i in ranked_scan(query, [key for _root, _folder, key in rows], limit)]
+
+
+def resolve_client(index, roots, query, find=None):
+    """Return the client meant by a 3-digit code or a name query, or None
+
+    A code is only looked up by code: an unknown one gives None and one used
+    by several folders raises AmbiguousClient. Names go through find(query,
+    limit), find_clients by default.
+    """
+    if query.isdigit() and len(query) == 3:
+        clients = [client_record(index, root, folder)
+                   for root, folder, code, _name in index.clients_of(roots) if code == query]
+        if len(clients) > 1:
+            raise AmbiguousClient(query, clients)
+        return clients[0] if clients else None
+    if find is None:
+        def find(query, limit):
+            return find_clients(index, roots, query, limit)
+    matches = find(query, 1)
+    return matches[0] if matches else None
+
+
+def last_drawing(index, client):
+    """Describe the last drawing of a client and its highest Rev-xx folder"""
+    drawing, revs = index.last_drawing(client['root'], client['folder'])
+    result = dict(client, drawing=drawing, revisions=revs, drawing_path=None, open_path=None)
+    if drawing:
+        result['drawing_path'] = os.path.join(client['path'], drawing)
+        result['open_path'] = os.path.join(result['drawing_path'], revs[-1]) if revs else result['drawing_path']
+    return result
+
+
+def next_drawing(index, client):
+    """Describe the drawing folder a new drawing of the client would get"""
+    name = next_drawing_name(client['code'], index.drawings(client['root'], client['folder']))
+    return dict(client, next_drawing=name, next_path=os.path.join(client['path'], name))
+
+
+def lookup_drawing(index, roots, number, limit=20):
+    """Resolve a full or partial drawing number to its folders and latest revision"""
+    results = []
+    for drawing, root, folder in index.drawing_map(roots).lookup(number, limit):
+        rev = index.latest_revision(root, folder, drawing)
+        drawing_path = os.path.join(index.client_path(root, folder), drawing)
+        results.append(dict(
+            client_record(index, root, folder),
+            drawing=drawing,
+            latest_revision=rev,
+            drawing_path=drawing_path,
+            open_path=os.path.join(drawing_path, rev) if rev else drawing_path,
+        ))
+    return results
+
+
+def find_files(index, roots, args):
+    """Query the file index with the filters given on the command line"""
+    since = time.time() - args.days * 86400 if args.days is not None else None
+    rows = index.find_files(roots, code=args.code, ext=args.ext, since=since,
+                            name=args.name, limit=args.limit)
+    return [
+        {
+            'root': root,
+            'folder': folder,
+            'drawing': drawing,
+            'rev': rev,
+            'name': name,
+            'size': size,
+            'mtime': mtime,
+            'path': index.file_path(root, folder, drawing, rev, name),
+        }
+        for root, folder, drawing, rev, name, size, mtime in rows
+    ]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='clientfinder',
+        description="Query clients and drawings from the local ClientFinder index"
+    )
+    parser.add_argument('--index', help="path of the index database")
+    parser.add_argument('--dir', action='append', choices=list(DIRECTORIES),
+                        help="restrict to a predefined directory (repeatable, default: all)")
+    parser.add_argument('--root', action='append', default=[], metavar='NAME=PATH',
+                        help="override or add a directory, e.g. Desenhos=/mnt/desenhos")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    find = commands.add_parser('find', help="search clients by name or code")
+    find.add_argument('query')
+    find.add_argument('--limit', type=int, default=20)
+
+    last = commands.add_parser('last', help="last drawing of a client")
+    last.add_argument('client', help="3-digit code or name")
+
+    next_ = commands.add_parser('next', help="next drawing number of a client")
+    next_.add_argument('client', help="3-digit code or name")
+
+    drawing = commands.add_parser('drawing', help="look up a full or partial drawing number")
+    drawing.add_argument('number')
+    drawing.add_argument('--limit', type=int, default=20)
+
+    files = commands.add_parser('files', help="query indexed files in Rev-xx folders")
+    files.add_argument('--code')
+    files.add_argument('--ext')
+    files.add_argument('--name')
+    files.add_argument('--days', type=float, help="only files modified in the last N days")
+    files.add_argument('--limit', type=int, default=200)
+
+    refresh = commands.add_parser('refresh', help="update the index incrementally")
+    refresh.add_argument('--deep', action='store_true')
+
+    commands.add_parser('build', help="index the directories down to the files")
+    return parser
+
+
+def run(args):
+    """Execute a parsed command and return its JSON-ready result"""
+    directories = dict(DIRECTORIES)
+    for override in args.root:
+        name, _, path = override.partition('=')
+        directories[name] = path
+    roots = args.dir or list(directories)
+    index = ClientIndex(directories, args.index)
+    try:
+        if args.command == 'find':
+            return find_clients(index, roots, args.query, args.limit)
+        if args.command in ('last', 'next'):
+            client = resolve_client(index, roots, args.client)
+            if client is None:
+                return None
+            if args.command == 'last':
+                return last_drawing(index, client)
+            return next_drawing(index, client)
+        if args.command == 'drawing':
+            return lookup_drawing(index, roots, args.number, args.limit)
+        if args.command == 'files':
+            return find_files(index, roots, args)
+        if args.command == 'refresh':
+            # Number of folders listed per directory
+            listings = {}
+            for root in roots:
+                if index.is_scanned(root):
+                    listings[root] = index.refresh(root, deep=args.deep)
+                else:
+                    index.scan_clients(root)
+                    listings[root] = 1
+            return listings
+        if args.command == 'build':
+            for root in roots:
+                index.build(root)
+            return {root: len(index.clients(root)) for root in roots}
+    finally:
+        index.close()
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        result = run(args)
+    except AmbiguousClient as e:
+        json.dump({'error': str(e), 'clients': e.clients}, sys.stderr, ensure_ascii=False)
+        sys.stderr.write('\n')
+        return 1
+    except OSError as e:
+        json.dump({'error': str(e)}, sys.stderr, ensure_ascii=False)
+        sys.stderr.write('\n')
+        return 1
+    json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write('\n')
+    return 0 if result is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,905 @@
+import heapq
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app_state import app_data_dir
+from client_search import normalize
+from share_fs import LOCAL_FS
+
+# Predefined directories on the engineering NAS
+DIRECTORIES = {
+    'Desenhos': r'\\192.168.1.252\Desenhos',
+    'Laser': r'\\192.168.1.252\Engenharia 1\Laser\\'
+}
+
+# Folder naming conventions used on the engineering shares
+CLIENT_PATTERN = re.compile(r'^(\d{3})\s*-\s*(.+)$')
+DRAWING_PATTERN = re.compile(r'^\d{3}-\d{4}$')
+REV_PATTERN = re.compile(r'^Rev-\d{2}$')
+
+# Full or partial drawing number typed in a search box, e.g. '110-0110' or '110-01'
+DRAWING_QUERY_PATTERN = re.compile(r'^\d{3}-\d{0,4}$')
+
+# 1 to 3 digits typed in a search box, looked up as the start of a client code
+CODE_QUERY_PATTERN = re.compile(r'^\d{1,3}$')
+
+# Roots whose client folders follow the "xxx - client name" convention
+CODED_ROOTS = ('Desenhos',)
+
+# Per-client drawing summaries kept in memory by ClientIndex
+SUMMARY_CACHE_SIZE = 256
+
+# Drawing numbers tried by ClientIndex.allocate_drawing before giving up
+ALLOCATE_ATTEMPTS = 100
+
+# Bumped whenever the tables change; an index with another version is rebuilt
+SCHEMA_VERSION = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS roots (
+    root TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    scanned_at REAL NOT NULL,
+    built_at REAL
+);
+CREATE TABLE IF NOT EXISTS clients (
+    root TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    code TEXT NOT NULL,
+    client_name TEXT NOT NULL,
+    search_key TEXT NOT NULL,
+    listed_mtime REAL,
+    PRIMARY KEY (root, folder)
+);
+CREATE TABLE IF NOT EXISTS subdirs (
+    root TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    listed_mtime REAL,
+    PRIMARY KEY (root, folder, name)
+);
+CREATE TABLE IF NOT EXISTS revisions (
+    id INTEGER PRIMARY KEY,
+    root TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    drawing TEXT NOT NULL,
+    rev TEXT NOT NULL,
+    mtime REAL,
+    listed_mtime REAL,
+    UNIQUE (root, folder, drawing, rev)
+);
+-- Files refer to their Rev-xx folder by id, so the folder path is stored once
+CREATE TABLE IF NOT EXISTS files (
+    rev_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    PRIMARY KEY (rev_id, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS files_by_ext ON files (ext, mtime, rev_id);
+"""
+
+TABLES = ('roots', 'clients', 'subdirs', 'revisions', 'files')
+
+
+def default_index_path():
+    """Return the per-user location of the index database"""
+    override = os.environ.get('CLIENTFINDER_INDEX')
+    if override:
+        return override
+    return os.path.join(app_data_dir(), 'index.sqlite3')
+
+
+def drawing_sort_key(name):
+    """Sort key for xxx-xxxx drawing folders, numeric on both parts"""
+    return tuple(map(int, name.split('-')))
+
+
+def rev_sort_key(name):
+    """Sort key for Rev-xx folders, numeric on the revision"""
+    return int(name.split('-')[1])
+
+
+def drawing_number(drawing):
+    """Return the sequence number of an xxx-xxxx drawing folder"""
+    return int(drawing.split('-')[1])
+
+
+def drawing_name(code, number):
+    return f"{code or '000'}-{number:04d}"
+
+
+def next_drawing_name(code, drawings):
+    """Return the drawing folder that follows a client's drawings sorted by number"""
+    return drawing_name(code, drawing_number(drawings[-1]) + 1 if drawings else 1)
+
+
+def parse_client_folder(folder, coded):
+    """Return (code, client_name) for a client folder, or None if it does not match"""
+    if not coded:
+        return '', folder
+    match = CLIENT_PATTERN.match(folder)
+    if not match:
+        return None
+    return match.groups()
+
+
+def list_subdirs(path, token=None, batch_size=200, fs=LOCAL_FS, stream=False):
+    """List (name, mtime) of the subdirectories of path in a single scandir pass
+
+    With a scan token the listing checks for cancellation. With stream it
+    also sends batches of entries to the token as they arrive; only the
+    listing whose entries the scan's caller expects may stream, e.g. the
+    client folders of a root, not the drawings listed while refreshing it.
+    """
+    subdirs = []
+    batch_start = 0
+    with fs.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                subdirs.append((entry.name, entry.stat().st_mtime))
+            if token is not None and len(subdirs) - batch_start >= batch_size:
+                if stream:
+                    token.emit(subdirs[batch_start:])
+                else:
+                    token.check()
+                batch_start = len(subdirs)
+    if token is not None:
+        token.check()
+    return subdirs
+
+
+def recent_subdirs(subdirs, count):
+    """Return the count most recently modified (name, mtime) subdirs, newest first
+
+    A bounded heap, so showing the top few of thousands of drawings does not
+    sort them all.
+    """
+    return heapq.nlargest(count, subdirs, key=lambda subdir: subdir[1])
+
+
+def list_files(path, token=None, fs=LOCAL_FS):
+    """List (name, size, mtime) of the regular files in path in a single scandir pass"""
+    files = []
+    with fs.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file():
+                stat = entry.stat()
+                files.append((entry.name, stat.st_size, stat.st_mtime))
+    if token is not None:
+        token.check()
+    return files
+
+
+class DrawingMap:
+    """Sorted map from drawing number to the client folders that hold it
+
+    Built once from the index, so a full or partial drawing number is
+    resolved with a binary search instead of walking the share.
+    """
+
+    def __init__(self, rows):
+        self.rows = sorted(rows)
+        self.numbers = [row[0] for row in self.rows]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def lookup(self, query, limit=100):
+        """Return (drawing, root, folder) rows whose drawing number starts with query"""
+        start = bisect_left(self.numbers, query)
+        end = start
+        while end < len(self.numbers) and end - start < limit and self.numbers[end].startswith(query):
+            end += 1
+        return self.rows[start:end]
+
+
+class CodeIndex:
+    """Client code -> client records, with prefix ranges over the sorted codes
+
+    Built from (code, record) pairs when a client list is loaded. A full code
+    is a dict lookup and a partial one a binary search, instead of a scan of
+    every name. Records come back in the order of the pairs (the lists give
+    them most used first). Codes used by more than one folder are kept in
+    duplicates and their records in flagged, so the lists can mark them.
+    """
+
+    def __init__(self, pairs):
+        by_code = {}
+        self.positions = {}
+        for position, (code, record) in enumerate(pairs):
+            by_code.setdefault(code, []).append(record)
+            self.positions[record] = position
+        self.by_code = by_code
+        self.codes = sorted(by_code)
+        self.duplicates = {code for code, records in by_code.items() if len(records) > 1}
+        self.flagged = {record for code in self.duplicates for record in by_code[code]}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def get(self, code):
+        """Return the records with exactly this code"""
+        return self.by_code.get(code, [])
+
+    def prefix(self, query):
+        """Return the records whose code starts with query, in the order they were given"""
+        start = index = bisect_left(self.codes, query)
+        records = []
+        while index < len(self.codes) and self.codes[index].startswith(query):
+            records.extend(self.by_code[self.codes[index]])
+            index += 1
+        if index - start > 1:
+            records.sort(key=self.positions.__getitem__)
+        return records
+
+
+class ClientRecord:
+    """A client folder, or one of its drawings, as listed by the finder
+
+    Records use __slots__ and share their directory strings, so hundreds of
+    thousands of them stay small; the full path is only joined when asked for.
+    Records are equal when they name the same folder (and drawing).
+    """
+
+    __slots__ = ('root', 'base', 'full_name', 'code', 'drawing')
+
+    def __init__(self, root, base, full_name, code, drawing=None):
+        self.root = sys.intern(root)
+        self.base = base
+        self.full_name = full_name
+        self.code = sys.intern(code)
+        self.drawing = drawing
+
+    @property
+    def path(self):
+        return os.path.join(self.base, self.full_name)
+
+    @property
+    def client_name(self):
+        match = CLIENT_PATTERN.match(self.full_name) if self.code else None
+        return match.group(2) if match else self.full_name
+
+    @property
+    def key(self):
+        return (self.root, self.full_name)
+
+    def with_drawing(self, drawing):
+        """The same client, pointing at one of its drawings"""
+        return ClientRecord(self.root, self.base, self.full_name, self.code, drawing)
+
+    def __eq__(self, other):
+        if not isinstance(other, ClientRecord):
+            return NotImplemented
+        return (self.root, self.full_name, self.drawing) == (other.root, other.full_name, other.drawing)
+
+    def __hash__(self):
+        return hash((self.root, self.full_name, self.drawing))
+
+    def __repr__(self):
+        return f"ClientRecord({self.root!r}, {self.full_name!r}, drawing={self.drawing!r})"
+
+
+class DrawingSummary:
+    """Sorted drawings of a client, its last drawing and that drawing's Rev-xx folders
+
+    mtime and last_mtime are the client and last drawing folder mtimes the
+    summary was built from, which is all it takes to validate it.
+    """
+
+    def __init__(self, drawings, revisions, mtime, last_mtime=None):
+        self.drawings = drawings
+        self.last = drawings[-1] if drawings else None
+        self.revisions = revisions
+        self.mtime = mtime
+        self.last_mtime = last_mtime
+
+
+class ClientIndex:
+    """Persistent SQLite index of clients, drawing folders, Rev-xx folders and their files
+
+    Client lists are served from the database once a root has been scanned.
+    Drawing, revision and file listings are cached per folder and revalidated
+    with a single stat of the folder, so an unchanged folder is never listed
+    again.
+    """
+
+    def __init__(self, directories, path=None, fs=None):
+        self.directories = directories
+        self.path = path or default_index_path()
+        # Every listing, stat and mkdir on the share goes through fs (share_fs)
+        self.fs = fs or LOCAL_FS
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.lock = threading.Lock()
+        # (root, folder) -> DrawingSummary, least recently used first
+        self.summaries = OrderedDict()
+        # (root, folder) -> highest drawing number known to exist
+        self.high_water = {}
+        # (root, folder) -> time.monotonic() of the last listing of a client folder
+        self.listed_at = {}
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            # The index is only a cache of the shares, so it is simply rebuilt
+            for table in TABLES:
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def root_path(self, root):
+        return self.directories[root]
+
+    def client_path(self, root, folder):
+        return os.path.join(self.directories[root], folder)
+
+    def is_scanned(self, root):
+        """Whether the client list of a root is available in the index"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM roots WHERE root = ? AND path = ?",
+                (root, self.directories[root])
+            ).fetchone()
+        return row is not None
+
+    def is_built(self, root):
+        """Whether build() indexed a root down to its files"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM roots WHERE root = ? AND path = ? AND built_at IS NOT NULL",
+                (root, self.directories[root])
+            ).fetchone()
+        return row is not None
+
+    def has_client(self, root, folder):
+        """Whether folder is an indexed client folder of root"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM clients WHERE root = ? AND folder = ?", (root, folder)
+            ).fetchone()
+        return row is not None
+
+    def clients(self, root, refresh=False, token=None):
+        """Return (folder, code, client_name) rows of a root, scanning it if needed
+
+        With refresh, an indexed root is first brought up to date incrementally.
+        """
+        if not self.is_scanned(root):
+            self.scan_clients(root, token=token)
+        elif refresh:
+            self.refresh(root, token=token)
+        with self.lock:
+            return self.conn.execute(
+                "SELECT folder, code, client_name FROM clients WHERE root = ? ORDER BY folder",
+                (root,)
+            ).fetchall()
+
+    def clients_of(self, roots, refresh=False, token=None):
+        """Return (root, folder, code, client_name) rows of several roots
+
+        Roots that still need a listing are scanned concurrently, so searching
+        every root costs the slowest listing rather than the sum of them.
+        """
+        roots = list(roots)
+        with ThreadPoolExecutor(max_workers=max(1, len(roots))) as pool:
+            # Listings made for the caller still count as the caller's
+            results = list(pool.map(self.fs.carry(
+                lambda root: self.clients(root, refresh=refresh, token=token)), roots))
+        return [(root,) + tuple(row) for root, rows in zip(roots, results) for row in rows]
+
+    def search_keys(self, roots):
+        """Return (root, folder, search_key) rows of several roots, ordered by folder
+
+        The keys are the normalized folder names stored when the roots were
+        scanned, so a one-off search needs no normalizing or search index.
+        """
+        roots = list(roots)
+        missing = [root for root in roots if not self.is_scanned(root)]
+        if missing:
+            self.clients_of(missing)
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT root, folder, search_key FROM clients "
+                f"WHERE root IN ({', '.join('?' * len(roots))}) ORDER BY folder, root",
+                roots
+            ).fetchall()
+
+    def snapshot(self, roots):
+        """Return the stored (root, folder, code, client_name) rows without touching the share
+
+        Returns None if any of the roots was never scanned.
+        """
+        if not all(self.is_scanned(root) for root in roots):
+            return None
+        rows = []
+        with self.lock:
+            for root in roots:
+                rows.extend(self.conn.execute(
+                    "SELECT root, folder, code, client_name FROM clients WHERE root = ? ORDER BY folder",
+                    (root,)
+                ))
+        return rows
+
+    def revalidate(self, roots, token=None):
+        """Bring the client lists of roots up to date and return them like clients_of()"""
+        return self.clients_of(roots, refresh=True, token=token)
+
+    def scan_clients(self, root, token=None):
+        """List the client folders of a root and store them in the index"""
+        coded = root in CODED_ROOTS
+        rows = []
+        for folder, mtime in list_subdirs(self.directories[root], token, fs=self.fs, stream=True):
+            parsed = parse_client_folder(folder, coded)
+            code, client_name = parsed if parsed else ('', folder)
+            rows.append((root, folder, code, client_name, mtime))
+
+        with self.lock, self.conn:
+            existing = {
+                folder for (folder,) in self.conn.execute(
+                    "SELECT folder FROM clients WHERE root = ?", (root,))
+            }
+            current = {row[1] for row in rows}
+            for folder in existing - current:
+                self._forget_client(root, folder)
+            # Keep listed_mtime of folders that are still there
+            self.conn.executemany(
+                "INSERT INTO clients (root, folder, code, client_name, search_key) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (root, folder) DO UPDATE SET "
+                "code = excluded.code, client_name = excluded.client_name",
+                [row[:4] + (normalize(row[1]),) for row in rows]
+            )
+            # A root built from another path no longer counts as built
+            self.conn.execute(
+                "INSERT INTO roots (root, path, scanned_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (root) DO UPDATE SET scanned_at = excluded.scanned_at, "
+                "built_at = CASE WHEN roots.path = excluded.path THEN roots.built_at END, "
+                "path = excluded.path",
+                (root, self.directories[root], time.time())
+            )
+        return rows
+
+    def _forget_client(self, root, folder):
+        self.conn.execute("DELETE FROM clients WHERE root = ? AND folder = ?", (root, folder))
+        self.conn.execute("DELETE FROM subdirs WHERE root = ? AND folder = ?", (root, folder))
+        self.conn.execute(
+            "DELETE FROM files WHERE rev_id IN (SELECT id FROM revisions WHERE root = ? AND folder = ?)",
+            (root, folder))
+        self.conn.execute("DELETE FROM revisions WHERE root = ? AND folder = ?", (root, folder))
+
+    def subdirs(self, root, folder, token=None, mtime=None, force=False, max_age=None):
+        """Return (name, mtime) of every subfolder of a client folder
+
+        The stored listing is reused while the client folder mtime is unchanged.
+        A caller that already knows the current mtime (from a parent listing)
+        passes it to save the stat; force lists the folder regardless.
+
+        The client folder mtime only proves that no subfolder was added or
+        removed: a drawing folder gaining a Rev-xx folder changes its own
+        mtime but not the client's. Callers that rank by the subfolder mtimes
+        pass max_age, and the folder is listed again unless this index listed
+        it in the last max_age seconds.
+        """
+        path = self.client_path(root, folder)
+        if max_age is not None:
+            with self.lock:
+                listed_at = self.listed_at.get((root, folder))
+            force = force or listed_at is None or time.monotonic() - listed_at > max_age
+        if mtime is None:
+            mtime = self.fs.stat(path).st_mtime
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT listed_mtime FROM clients WHERE root = ? AND folder = ?",
+                (root, folder)
+            ).fetchone()
+            if row is not None and row[0] == mtime and not force:
+                return self.conn.execute(
+                    "SELECT name, mtime FROM subdirs WHERE root = ? AND folder = ?",
+                    (root, folder)
+                ).fetchall()
+
+        subdirs = list_subdirs(path, token, fs=self.fs)
+        with self.lock, self.conn:
+            current = {name for name, _sub_mtime in subdirs}
+            for (name,) in self.conn.execute(
+                    "SELECT name FROM subdirs WHERE root = ? AND folder = ?",
+                    (root, folder)).fetchall():
+                if name not in current:
+                    self.conn.execute(
+                        "DELETE FROM subdirs WHERE root = ? AND folder = ? AND name = ?",
+                        (root, folder, name))
+                    self.conn.execute(
+                        "DELETE FROM files WHERE rev_id IN (SELECT id FROM revisions "
+                        "WHERE root = ? AND folder = ? AND drawing = ?)",
+                        (root, folder, name))
+                    self.conn.execute(
+                        "DELETE FROM revisions WHERE root = ? AND folder = ? AND drawing = ?",
+                        (root, folder, name))
+            # Keep listed_mtime of subfolders whose Rev-xx listing is already stored
+            self.conn.executemany(
+                "INSERT INTO subdirs (root, folder, name, mtime) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (root, folder, name) DO UPDATE SET mtime = excluded.mtime",
+                [(root, folder, name, sub_mtime) for name, sub_mtime in subdirs]
+            )
+            coded = root in CODED_ROOTS
+            parsed = parse_client_folder(folder, coded)
+            code, client_name = parsed if parsed else ('', folder)
+            self.conn.execute(
+                "INSERT INTO clients (root, folder, code, client_name, search_key, listed_mtime) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (root, folder) "
+                "DO UPDATE SET listed_mtime = excluded.listed_mtime",
+                (root, folder, code, client_name, normalize(folder), mtime)
+            )
+            self.listed_at[(root, folder)] = time.monotonic()
+        return subdirs
+
+    def drawings(self, root, folder, token=None):
+        """Return the xxx-xxxx drawing folders of a client, sorted by drawing number"""
+        drawings = [name for name, _mtime in self.subdirs(root, folder, token)
+                    if DRAWING_PATTERN.match(name)]
+        return sorted(drawings, key=drawing_sort_key)
+
+    def revisions(self, root, folder, drawing, token=None, mtime=None, force=False):
+        """Return the Rev-xx folders of a drawing, sorted by revision number
+
+        Listing the drawing also stores the current mtime of each Rev-xx
+        folder; force lists it even if the drawing folder is unchanged.
+        """
+        path = os.path.join(self.client_path(root, folder), drawing)
+        if mtime is None:
+            mtime = self.fs.stat(path).st_mtime
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT listed_mtime FROM subdirs WHERE root = ? AND folder = ? AND name = ?",
+                (root, folder, drawing)
+            ).fetchone()
+            if row is not None and row[0] == mtime and not force:
+                revs = [rev for (rev,) in self.conn.execute(
+                    "SELECT rev FROM revisions WHERE root = ? AND folder = ? AND drawing = ?",
+                    (root, folder, drawing)
+                )]
+                return sorted(revs, key=rev_sort_key)
+
+        listed = [(name, rev_mtime) for name, rev_mtime in list_subdirs(path, token, fs=self.fs)
+                  if REV_PATTERN.match(name)]
+        revs = [name for name, _rev_mtime in listed]
+        with self.lock, self.conn:
+            for rev_id, rev in self.conn.execute(
+                    "SELECT id, rev FROM revisions WHERE root = ? AND folder = ? AND drawing = ?",
+                    (root, folder, drawing)).fetchall():
+                if rev not in revs:
+                    self.conn.execute("DELETE FROM files WHERE rev_id = ?", (rev_id,))
+                    self.conn.execute("DELETE FROM revisions WHERE id = ?", (rev_id,))
+            # Keep listed_mtime of Rev-xx folders whose files are already stored
+            self.conn.executemany(
+                "INSERT INTO revisions (root, folder, drawing, rev, mtime) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (root, folder, drawing, rev) DO UPDATE SET mtime = excluded.mtime",
+                [(root, folder, drawing, rev, rev_mtime) for rev, rev_mtime in listed]
+            )
+            self.conn.execute(
+                "INSERT INTO subdirs (root, folder, name, mtime, listed_mtime) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (root, folder, name) "
+                "DO UPDATE SET mtime = excluded.mtime, listed_mtime = excluded.listed_mtime",
+                (root, folder, drawing, mtime, mtime)
+            )
+        return sorted(revs, key=rev_sort_key)
+
+    def drawing_summary(self, root, folder, token=None):
+        """Return the DrawingSummary of a client, from memory while its folders are unchanged
+
+        A cached summary costs one stat of the client folder and one of its
+        last drawing; selecting, opening and creating a drawing all share it.
+        """
+        key = (root, folder)
+        path = self.client_path(root, folder)
+        mtime = self.fs.stat(path).st_mtime
+        with self.lock:
+            summary = self.summaries.get(key)
+            if summary is not None:
+                self.summaries.move_to_end(key)
+
+        if summary is not None and summary.mtime == mtime:
+            if summary.last is None:
+                return summary
+            last_mtime = self.fs.stat(os.path.join(path, summary.last)).st_mtime
+            if last_mtime == summary.last_mtime:
+                return summary
+            # Only the Rev-xx folders of the last drawing changed
+            drawings = summary.drawings
+        else:
+            drawings = tuple(sorted((name for name, _sub_mtime in self.subdirs(root, folder, token, mtime)
+                                     if DRAWING_PATTERN.match(name)), key=drawing_sort_key))
+            last_mtime = self.fs.stat(os.path.join(path, drawings[-1])).st_mtime if drawings else None
+
+        revisions = ()
+        if drawings:
+            revisions = tuple(self.revisions(root, folder, drawings[-1], token, last_mtime))
+        summary = DrawingSummary(drawings, revisions, mtime, last_mtime)
+        with self.lock:
+            self.summaries[key] = summary
+            self.summaries.move_to_end(key)
+            while len(self.summaries) > SUMMARY_CACHE_SIZE:
+                self.summaries.popitem(last=False)
+        return summary
+
+    def allocate_drawing(self, root, folder, code):
+        """Create the next drawing folder of a client and return its name
+
+        The folder is reserved with an exclusive mkdir, so two workstations
+        creating a drawing at the same moment never get the same number: the
+        one that loses the race gets FileExistsError and tries the next number.
+        Numbering starts after the last drawing of the cached summary (one stat
+        while the client folder is unchanged) or after the highest number
+        allocated here, whichever is higher, so usually a single mkdir is all
+        it costs.
+        """
+        key = (root, folder)
+        drawings = self.drawing_summary(root, folder).drawings
+        number = drawing_number(drawings[-1]) if drawings else 0
+        with self.lock:
+            number = max(number, self.high_water.get(key, 0))
+
+        path = self.client_path(root, folder)
+        for _attempt in range(ALLOCATE_ATTEMPTS):
+            number += 1
+            name = drawing_name(code, number)
+            try:
+                self.fs.mkdir(os.path.join(path, name))
+            except FileExistsError:
+                # Taken by someone else since our listing
+                continue
+            with self.lock:
+                self.high_water[key] = max(number, self.high_water.get(key, 0))
+            return name
+        raise FileExistsError(f"no free drawing number after {drawing_name(code, number)} in {path}")
+
+    def last_drawing(self, root, folder, token=None):
+        """Return the highest numbered drawing of a client and its Rev-xx folders"""
+        summary = self.drawing_summary(root, folder, token)
+        return summary.last, list(summary.revisions)
+
+    def latest_revision(self, root, folder, drawing, token=None):
+        """Return the highest Rev-xx folder of a drawing, or None if it has none"""
+        revs = self.revisions(root, folder, drawing, token)
+        return revs[-1] if revs else None
+
+    def index_drawings(self, root, token=None):
+        """List the client folders of a root whose drawings are not indexed yet"""
+        with self.lock:
+            pending = [folder for (folder,) in self.conn.execute(
+                "SELECT folder FROM clients WHERE root = ? AND listed_mtime IS NULL",
+                (root,)
+            )]
+        for folder in pending:
+            if token is not None:
+                token.check()
+            try:
+                self.subdirs(root, folder)
+            except FileNotFoundError:
+                # Removed since the client list was scanned
+                continue
+
+    def drawing_map(self, roots, token=None):
+        """Build the drawing number map of several roots, indexing missing clients first"""
+        rows = []
+        for root in roots:
+            self.index_drawings(root, token)
+            with self.lock:
+                rows.extend(self.conn.execute(
+                    "SELECT name, root, folder FROM subdirs WHERE root = ? "
+                    "AND name GLOB '[0-9][0-9][0-9]-[0-9][0-9][0-9][0-9]'",
+                    (root,)
+                ))
+        return DrawingMap(rows)
+
+    def files(self, root, folder, drawing, rev, token=None, mtime=None):
+        """Return (name, size, mtime) of the files in a Rev-xx folder, sorted by name
+
+        Like the other listings this is revalidated against the folder mtime,
+        which changes when files are added, removed or saved by replacement.
+        """
+        path = os.path.join(self.client_path(root, folder), drawing, rev)
+        if mtime is None:
+            mtime = self.fs.stat(path).st_mtime
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, listed_mtime FROM revisions "
+                "WHERE root = ? AND folder = ? AND drawing = ? AND rev = ?",
+                (root, folder, drawing, rev)
+            ).fetchone()
+            if row is not None and row[1] == mtime:
+                return self.conn.execute(
+                    "SELECT name, size, mtime FROM files WHERE rev_id = ? ORDER BY name",
+                    (row[0],)
+                ).fetchall()
+
+        files = sorted(list_files(path, token, fs=self.fs))
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO revisions (root, folder, drawing, rev, mtime, listed_mtime) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (root, folder, drawing, rev) "
+                "DO UPDATE SET mtime = excluded.mtime, listed_mtime = excluded.listed_mtime",
+                (root, folder, drawing, rev, mtime, mtime)
+            )
+            (rev_id,) = self.conn.execute(
+                "SELECT id FROM revisions WHERE root = ? AND folder = ? AND drawing = ? AND rev = ?",
+                (root, folder, drawing, rev)
+            ).fetchone()
+            self.conn.execute("DELETE FROM files WHERE rev_id = ?", (rev_id,))
+            self.conn.executemany(
+                "INSERT INTO files (rev_id, name, ext, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                [(rev_id, name, os.path.splitext(name)[1].lower(), size, file_mtime)
+                 for name, size, file_mtime in files]
+            )
+        return files
+
+    def find_files(self, roots=None, code=None, ext=None, since=None, name=None, limit=None):
+        """Query indexed files without touching the share
+
+        Returns (root, folder, drawing, rev, name, size, mtime) rows, newest
+        first. Every filter is optional: roots restricts the predefined
+        directories, code the 3-digit client code, ext the extension (with or
+        without the dot), since a minimum mtime and name a substring of the
+        file name. For example, every .dxf of client 110 modified this month:
+        find_files(code='110', ext='dxf', since=<first day of the month>).
+
+        Only Rev-xx folders indexed by build(), and kept current by refresh(),
+        or opened while browsing are covered; the GUIs do not index files on
+        their own, so run build() once per root first.
+        """
+        conditions = []
+        params = []
+        if roots:
+            conditions.append(f"r.root IN ({', '.join('?' * len(roots))})")
+            params.extend(roots)
+        if code:
+            conditions.append("c.code = ?")
+            params.append(code)
+        if ext:
+            conditions.append("f.ext = ?")
+            params.append(ext.lower() if ext.startswith('.') else '.' + ext.lower())
+        if since is not None:
+            conditions.append("f.mtime >= ?")
+            params.append(since)
+        if name:
+            conditions.append("f.name LIKE ?")
+            params.append(f"%{name}%")
+        sql = ("SELECT r.root, r.folder, r.drawing, r.rev, f.name, f.size, f.mtime FROM files f "
+               "JOIN revisions r ON r.id = f.rev_id "
+               "JOIN clients c ON c.root = r.root AND c.folder = r.folder")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY f.mtime DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def file_path(self, root, folder, drawing, rev, name):
+        return os.path.join(self.client_path(root, folder), drawing, rev, name)
+
+    def refresh(self, root, deep=False, token=None):
+        """Bring an indexed root up to date, listing only folders whose mtime changed
+
+        The root is listed once and each client folder mtime is compared with
+        the one stored when it was last listed. Only changed client folders are
+        listed again, and inside them only drawing and Rev-xx folders whose
+        mtime changed, so the cost grows with the amount of change rather than
+        with the share size. A folder mtime only changes when entries are
+        added, removed or renamed directly inside it; deep also lists every
+        indexed client and drawing folder, to catch new Rev-xx folders in
+        older drawings and files saved into existing Rev-xx folders.
+        In a root indexed by build(), folders never listed so far (new
+        clients, drawings and Rev-xx folders) are then indexed as build()
+        would; elsewhere they are left to index_drawings() and build().
+        Returns the number of folders listed.
+        """
+        with self.lock:
+            listed_clients = dict(self.conn.execute(
+                "SELECT folder, listed_mtime FROM clients WHERE root = ? AND listed_mtime IS NOT NULL",
+                (root,)
+            ).fetchall())
+        listings = 1
+        for _root, folder, _code, _name, mtime in self.scan_clients(root, token):
+            if folder not in listed_clients or (listed_clients[folder] == mtime and not deep):
+                continue
+            if token is not None:
+                token.check()
+            with self.lock:
+                listed_drawings = dict(self.conn.execute(
+                    "SELECT name, listed_mtime FROM subdirs "
+                    "WHERE root = ? AND folder = ? AND listed_mtime IS NOT NULL",
+                    (root, folder)
+                ).fetchall())
+            listings += 1
+            for drawing, drawing_mtime in self.subdirs(root, folder, token, mtime=mtime, force=deep):
+                listed_mtime = listed_drawings.get(drawing)
+                if listed_mtime is None or (listed_mtime == drawing_mtime and not deep):
+                    continue
+                listings += 1
+                # The listing stores the current Rev-xx mtimes, compared below
+                self.revisions(root, folder, drawing, token, mtime=drawing_mtime, force=deep)
+                with self.lock:
+                    changed_revs = self.conn.execute(
+                        "SELECT rev, mtime FROM revisions WHERE root = ? AND folder = ? "
+                        "AND drawing = ? AND listed_mtime IS NOT NULL AND listed_mtime != mtime",
+                        (root, folder, drawing)
+                    ).fetchall()
+                for rev, rev_mtime in changed_revs:
+                    listings += 1
+                    self.files(root, folder, drawing, rev, token, mtime=rev_mtime)
+        if self.is_built(root):
+            listings += self.index_unlisted(root, token)
+        return listings
+
+    def index_unlisted(self, root, token=None):
+        """List the client, drawing and Rev-xx folders of a root that were never listed
+
+        A listing of a client folder, by refresh() or while browsing, stores
+        its new drawing folders without listing them, and listing a drawing
+        does the same for its Rev-xx folders. This lists them, level by
+        level, and returns the number of folders listed.
+        """
+        listings = 0
+        with self.lock:
+            clients = [folder for (folder,) in self.conn.execute(
+                "SELECT folder FROM clients WHERE root = ? AND listed_mtime IS NULL", (root,))]
+        for folder in clients:
+            if token is not None:
+                token.check()
+            try:
+                self.subdirs(root, folder, token)
+            except FileNotFoundError:
+                # Removed since the client list was scanned
+                continue
+            listings += 1
+
+        with self.lock:
+            drawings = self.conn.execute(
+                "SELECT folder, name FROM subdirs WHERE root = ? AND listed_mtime IS NULL "
+                "AND name GLOB '[0-9][0-9][0-9]-[0-9][0-9][0-9][0-9]'",
+                (root,)
+            ).fetchall()
+        for folder, drawing in drawings:
+            if token is not None:
+                token.check()
+            try:
+                self.revisions(root, folder, drawing, token)
+            except FileNotFoundError:
+                continue
+            listings += 1
+
+        with self.lock:
+            revisions = self.conn.execute(
+                "SELECT folder, drawing, rev FROM revisions WHERE root = ? AND listed_mtime IS NULL",
+                (root,)
+            ).fetchall()
+        for folder, drawing, rev in revisions:
+            if token is not None:
+                token.check()
+            try:
+                self.files(root, folder, drawing, rev, token)
+            except FileNotFoundError:
+                continue
+            listings += 1
+        return listings
+
+    def build(self, root):
+        """Scan a whole root down to the files in the Rev-xx folders so later browsing stays local"""
+        for _root, folder, _code, _name, _mtime in self.scan_clients(root):
+            for drawing in self.drawings(root, folder):
+                for rev in self.revisions(root, folder, drawing):
+                    self.files(root, folder, drawing, rev)
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE roots SET built_at = ? WHERE root = ?", (time.time(), root))
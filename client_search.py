@@ -0,0 +1,162 @@
+import heapq
+from collections import Counter
+from itertools import chain
+
+from unidecode import unidecode
+
+
+def normalize(text):
+    """Lowercase and strip accents so 'São João' matches 'sao joao'"""
+    return unidecode(text.lower())
+
+
+def trigrams(key):
+    """Return the set of 3-character substrings of a normalized key"""
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+def fuzzy_scan(query, keys, limit=20, min_score=0.35):
+    """Return (score, position) of the normalized keys most similar to query, best first
+
+    Ranks like ClientSearchIndex.fuzzy but takes the trigrams of each key as
+    it goes, for one-off queries that would not pay back building postings.
+    """
+    grams = trigrams(f' {normalize(query).strip()} ')
+    if not grams:
+        return []
+    total = len(grams)
+    minimum = max(1, min_score * total)
+    ranked = heapq.nlargest(limit, (
+        (count, -len(key), -i) for i, key in enumerate(keys)
+        for count in (len(grams & trigrams(f' {key} ')),) if count >= minimum
+    ))
+    return [(count / total, -i) for count, _length, i in ranked]
+
+
+def ranked_scan(query, keys, limit=20):
+    """Return the positions ranked_filter would pick, in one pass over normalized keys"""
+    query = normalize(query)
+    result = [i for i, key in enumerate(keys) if query in key][:limit]
+    if not result and len(query.strip()) >= 3:
+        result = [i for _score, i in fuzzy_scan(query, keys, limit)]
+    return result
+
+
+class ClientSearchIndex:
+    """In-memory substring index over unidecode-normalized client names
+
+    Every name is normalized once when the index is built. Queries of three
+    or more characters intersect the posting lists of their trigrams and only
+    verify the surviving candidates; shorter queries scan the precomputed
+    keys, which stays far below a frame even for 20k names.
+
+    Keys are padded with a space on both sides before taking trigrams, so the
+    same postings also rank typo-tolerant matches by word starts and ends.
+    """
+
+    # Stop intersecting posting lists once this few candidates remain
+    VERIFY_THRESHOLD = 64
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.keys = [normalize(name) for name in self.names]
+        postings = {}
+        for i, key in enumerate(self.keys):
+            for gram in trigrams(f' {key} '):
+                postings.setdefault(gram, []).append(i)
+        self.postings = postings
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, query):
+        """Return the positions of the names containing query, in name order"""
+        query = normalize(query)
+        if not query:
+            return list(range(len(self.names)))
+        if len(query) < 3:
+            return [i for i, key in enumerate(self.keys) if query in key]
+
+        # Intersect from the rarest trigram up
+        lists = sorted((self.postings.get(gram, ()) for gram in trigrams(query)), key=len)
+        if not lists[0]:
+            return []
+        candidates = set(lists[0])
+        for posting in lists[1:]:
+            if len(candidates) <= self.VERIFY_THRESHOLD:
+                break
+            candidates.intersection_update(posting)
+        keys = self.keys
+        return [i for i in sorted(candidates) if query in keys[i]]
+
+    def matches(self, query):
+        """Return the names containing query, in name order"""
+        names = self.names
+        return [names[i] for i in self.search(query)]
+
+    def fuzzy(self, query, limit=20, min_score=0.35):
+        """Return (score, position) of the names most similar to query, best first
+
+        The score is the share of the query's trigrams found in the name, so a
+        typo such as 'perfsul' only loses the trigrams around it and still
+        ranks 'Perfisul' first. Ties go to the shorter name.
+        """
+        grams = trigrams(f' {normalize(query).strip()} ')
+        if not grams:
+            return []
+        counts = Counter(chain.from_iterable(self.postings.get(gram, ()) for gram in grams))
+        total = len(grams)
+        minimum = min_score * total
+        keys = self.keys
+        ranked = heapq.nlargest(limit, (
+            (count, -len(keys[i]), -i) for i, count in counts.items() if count >= minimum
+        ))
+        return [(count / total, -i) for count, _length, i in ranked]
+
+    def fuzzy_matches(self, query, limit=20):
+        """Return the names most similar to query, best first"""
+        names = self.names
+        return [names[i] for _score, i in self.fuzzy(query, limit)]
+
+
+class FilterEngine:
+    """Incremental filter over client records with cached normalized keys
+
+    Keys are normalized once per record. When a query contains the previous
+    query, its matches can only be among the previous matches, so only those
+    are checked; any other query goes through the trigram index.
+    """
+
+    def __init__(self, records, key=lambda record: record):
+        self.records = list(records)
+        self.index = ClientSearchIndex(key(record) for record in self.records)
+        self.last_query = None
+        self.last_result = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def search(self, query):
+        """Return the positions of the records matching query, in record order"""
+        query = normalize(query)
+        if self.last_query and self.last_query in query:
+            keys = self.index.keys
+            result = [i for i in self.last_result if query in keys[i]]
+        else:
+            result = self.index.search(query)
+        self.last_query = query
+        self.last_result = result
+        return result
+
+    def filter(self, query):
+        """Return the records matching query, in record order"""
+        records = self.records
+        return [records[i] for i in self.search(query)]
+
+    def ranked_filter(self, query, limit=20):
+        """Return the records containing query, or the best fuzzy matches if none do"""
+        records = self.records
+        result = self.search(query)
+        if not result and len(normalize(query).strip()) >= 3:
+            result = [i for _score, i in self.index.fuzzy(query, limit)]
+        return [records[i] for i in result]
@@ -0,0 +1,417 @@
+"""Shared client/drawing index service
+
+One process owns a warm ClientIndex and answers many workstations over HTTP,
+so the NAS is listed once instead of once per engineer:
+
+    python index_server.py --host 0.0.0.0 --port 8765
+
+Workstations point ClientTab at it with the CLIENTFINDER_SERVER environment
+variable, e.g. CLIENTFINDER_SERVER=http://engenharia-srv:8765. For a local
+trial run it against a test tree:
+
+    python index_server.py --root Desenhos=/tmp/Desenhos --root Laser=/tmp/Laser
+
+Folder and drawing parameters must name an indexed client and one of its
+subfolders; anything else, including paths, is answered with 400.
+
+    python index_server.py --self-test
+
+serves a small generated tree on a free localhost port and checks the
+queries, including those rejections, through IndexServiceClient, and that
+refreshes keep a built index current.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from client_finder_cli import (client_record, last_drawing, lookup_drawing, next_drawing,
+                               resolve_client)
+from client_index import DIRECTORIES, ClientIndex, DrawingMap
+from client_search import FilterEngine
+
+
+class UnknownQuery(LookupError):
+    """Raised for a request path the service does not answer"""
+
+
+def is_plain_name(name):
+    """Whether name is a single folder name, not a path or a parent reference"""
+    return bool(name) and name not in ('.', '..') and not any(sep in name for sep in '/\\:\0')
+
+
+class IndexService:
+    """A ClientIndex plus the in-memory search structures built from it
+
+    Client filters and drawing maps are cached per set of roots and dropped
+    whenever the index is refreshed.
+    """
+
+    def __init__(self, directories, index_path=None):
+        self.index = ClientIndex(directories, index_path)
+        self.lock = threading.Lock()
+        self.engines = {}
+        self.drawing_maps = {}
+
+    def roots(self, names):
+        """Validate requested root names, defaulting to every directory"""
+        if not names:
+            return list(self.index.directories)
+        unknown = [name for name in names if name not in self.index.directories]
+        if unknown:
+            raise ValueError(f"unknown directory: {', '.join(unknown)}")
+        return names
+
+    def clients(self, roots):
+        return self.index.clients_of(roots)
+
+    def client_folder(self, root, folder):
+        """Return folder if it is an indexed client of root, else raise ValueError
+
+        Folders are joined to the root path, so only names the index listed
+        there are accepted; a path would list any directory on the host.
+        """
+        if not self.index.is_scanned(root):
+            self.index.scan_clients(root)
+        if not is_plain_name(folder) or not self.index.has_client(root, folder):
+            raise ValueError(f"unknown client folder: {folder!r}")
+        return folder
+
+    def drawing_folder(self, root, folder, drawing):
+        """Return drawing if it is a subfolder of an indexed client, else raise ValueError"""
+        self.client_folder(root, folder)
+        if not is_plain_name(drawing) or drawing not in {
+                name for name, _mtime in self.index.subdirs(root, folder)}:
+            raise ValueError(f"unknown drawing folder: {drawing!r}")
+        return drawing
+
+    def find(self, roots, query, limit):
+        key = tuple(roots)
+        with self.lock:
+            engine = self.engines.get(key)
+            if engine is None:
+                records = sorted((folder, root) for root, folder, _code, _name in self.clients(roots))
+                engine = FilterEngine([(root, folder) for folder, root in records],
+                                      key=lambda record: record[1])
+                self.engines[key] = engine
+            matches = engine.ranked_filter(query, limit)[:limit]
+        return [client_record(self.index, root, folder) for root, folder in matches]
+
+    def drawing_map(self, roots):
+        key = tuple(roots)
+        with self.lock:
+            drawing_map = self.drawing_maps.get(key)
+        if drawing_map is None:
+            drawing_map = self.index.drawing_map(roots)
+            with self.lock:
+                self.drawing_maps[key] = drawing_map
+        return drawing_map
+
+    def refresh(self, roots, deep=False):
+        """Refresh the index incrementally and drop the search structures built from it"""
+        listings = {}
+        for root in roots:
+            if self.index.is_scanned(root):
+                listings[root] = self.index.refresh(root, deep=deep)
+            else:
+                self.index.scan_clients(root)
+                listings[root] = 1
+        with self.lock:
+            self.engines.clear()
+            self.drawing_maps.clear()
+        return listings
+
+    def handle(self, path, params):
+        """Answer one query; params maps names to lists of values as parse_qs does"""
+        roots = self.roots(params.get('root', []))
+
+        def param(name, default=None):
+            values = params.get(name)
+            return values[0] if values else default
+
+        def single_root():
+            if len(params.get('root', [])) != 1:
+                raise ValueError("exactly one root is required")
+            return roots[0]
+
+        if path == '/clients':
+            return [list(row) for row in self.clients(roots)]
+        if path == '/find':
+            return self.find(roots, param('q', ''), int(param('limit', 20)))
+        if path in ('/last', '/next'):
+            client = resolve_client(self.index, roots, param('client', ''),
+                                    find=lambda query, limit: self.find(roots, query, limit))
+            if client is None:
+                return None
+            return last_drawing(self.index, client) if path == '/last' else next_drawing(self.index, client)
+        if path == '/drawing':
+            return lookup_drawing(self.index, roots, param('number', ''), int(param('limit', 20)))
+        if path == '/drawing-map':
+            return [list(row) for row in self.drawing_map(roots).rows]
+        if path == '/subdirs':
+            root = single_root()
+            folder = self.client_folder(root, param('folder', ''))
+            max_age = param('max_age')
+            return [list(row) for row in self.index.subdirs(
+                root, folder, max_age=None if max_age is None else float(max_age))]
+        if path == '/latest-revision':
+            root = single_root()
+            folder = param('folder', '')
+            drawing = self.drawing_folder(root, folder, param('drawing', ''))
+            return self.index.latest_revision(root, folder, drawing)
+        if path == '/refresh':
+            return self.refresh(roots, deep=param('deep') == '1')
+        raise UnknownQuery(path)
+
+    def close(self):
+        self.index.close()
+
+
+class IndexRequestHandler(BaseHTTPRequestHandler):
+    """GET /<query>?root=...&... -> JSON"""
+
+    service = None
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        try:
+            status, body = 200, self.service.handle(url.path, urllib.parse.parse_qs(url.query))
+        except UnknownQuery:
+            status, body = 404, {'error': f"unknown query {url.path}"}
+        except ValueError as e:
+            status, body = 400, {'error': str(e)}
+        except OSError as e:
+            status, body = 502, {'error': str(e)}
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Keep the console quiet; one line per request is too much on a busy day
+        pass
+
+
+def make_server(directories, host='127.0.0.1', port=8765, index_path=None):
+    """Create (but do not start) an HTTP server over a new IndexService
+
+    Port 0 picks a free port, which is what local test runs want; the actual
+    address is server.server_address.
+    """
+    service = IndexService(directories, index_path)
+    handler = type('BoundIndexRequestHandler', (IndexRequestHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.service = service
+    return server
+
+
+def start_refresh_loop(server, interval):
+    """Refresh the index incrementally every interval seconds in a daemon thread"""
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                server.service.refresh(list(server.service.index.directories))
+            except OSError:
+                # The NAS may be briefly unreachable; try again next round
+                continue
+
+    threading.Thread(target=loop, name='index-refresh', daemon=True).start()
+    return stop
+
+
+class IndexServiceClient:
+    """Talks to an index service with the ClientIndex methods ClientTab uses
+
+    Listings come from the service instead of the share, so a workstation
+    using it never lists the NAS itself.
+    """
+
+    def __init__(self, base_url, directories, timeout=5):
+        self.base_url = base_url.rstrip('/')
+        self.directories = directories
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls, directories):
+        """Return a client for CLIENTFINDER_SERVER, or None when it is not set"""
+        url = os.environ.get('CLIENTFINDER_SERVER')
+        return cls(url, directories) if url else None
+
+    def get(self, path, **params):
+        query = urllib.parse.urlencode(params, doseq=True)
+        try:
+            with urllib.request.urlopen(f"{self.base_url}{path}?{query}", timeout=self.timeout) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            raise OSError(f"index service: {json.load(e).get('error', e.reason)}") from e
+        except urllib.error.URLError as e:
+            raise OSError(f"index service unreachable: {e.reason}") from e
+
+    def client_path(self, root, folder):
+        return os.path.join(self.directories[root], folder)
+
+    def clients(self, root, refresh=False, token=None):
+        if refresh:
+            self.get('/refresh', root=root)
+        return [tuple(row[1:]) for row in self.get('/clients', root=root)]
+
+    def clients_of(self, roots, refresh=False, token=None):
+        if refresh:
+            self.get('/refresh', root=roots)
+        return [tuple(row) for row in self.get('/clients', root=roots)]
+
+    def snapshot(self, roots):
+        # No local copy; the service itself is the warm snapshot
+        return None
+
+    def revalidate(self, roots, token=None):
+        # The service refreshes on its own schedule
+        return self.clients_of(roots, token=token)
+
+    def subdirs(self, root, folder, token=None, max_age=None):
+        params = {} if max_age is None else {'max_age': max_age}
+        return [tuple(row) for row in self.get('/subdirs', root=root, folder=folder, **params)]
+
+    def latest_revision(self, root, folder, drawing, token=None):
+        return self.get('/latest-revision', root=root, folder=folder, drawing=drawing)
+
+    def drawing_map(self, roots, token=None):
+        return DrawingMap(tuple(row) for row in self.get('/drawing-map', root=roots))
+
+    def find(self, query, roots=(), limit=20):
+        return self.get('/find', q=query, root=list(roots), limit=limit)
+
+    def last(self, client, roots=()):
+        return self.get('/last', client=client, root=list(roots))
+
+    def next(self, client, roots=()):
+        return self.get('/next', client=client, root=list(roots))
+
+
+def self_test():
+    """Serve a generated tree on a free localhost port and check queries against it
+
+    Returns the descriptions of the failed checks, empty when all passed.
+    """
+    # Only needed here; the benchmark builds the same kind of tree
+    from client_finder_bench import make_share_tree
+
+    failures = []
+
+    def check(description, ok):
+        if not ok:
+            failures.append(description)
+
+    def status(path, **params):
+        url = f"{client.base_url}{path}?{urllib.parse.urlencode(params)}"
+        try:
+            with urllib.request.urlopen(url, timeout=client.timeout) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    base = tempfile.mkdtemp(prefix='clientfinder-service-')
+    server = None
+    try:
+        directories = make_share_tree(os.path.join(base, 'share'), clients=5, drawings=3)
+        server = make_server(directories, port=0, index_path=os.path.join(base, 'index.sqlite3'))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = IndexServiceClient(f"http://127.0.0.1:{server.server_address[1]}", directories)
+
+        rows = client.clients_of(['Desenhos'])
+        check("/clients lists the generated clients", len(rows) == 5)
+        folder, code = rows[0][1], rows[0][2]
+        subdirs = client.subdirs('Desenhos', folder)
+        check("/subdirs lists the drawings of a client", len(subdirs) == 3)
+        drawing = f"{code}-0003"
+        check("/latest-revision answers the highest Rev-xx folder",
+              client.latest_revision('Desenhos', folder, drawing) == 'Rev-01')
+        check("/last answers the last drawing", client.last(code)['drawing'] == drawing)
+        check("/next answers the next drawing", client.next(code)['next_drawing'] == f"{code}-0004")
+        check("/drawing-map maps every drawing", len(client.drawing_map(['Desenhos'])) == 15)
+
+        outside = os.path.dirname(directories['Desenhos'])
+        for bad in (outside, '/etc', '..', os.path.join('..', 'Laser'), f"{folder}/{drawing}", 'missing'):
+            check(f"/subdirs rejects folder {bad!r}",
+                  status('/subdirs', root='Desenhos', folder=bad) == 400)
+        for bad in ('..', os.path.join('..', folder), 'Rev-00', f"{code}-0099"):
+            check(f"/latest-revision rejects drawing {bad!r}",
+                  status('/latest-revision', root='Desenhos', folder=folder, drawing=bad) == 400)
+        check("/latest-revision rejects a folder outside the root",
+              status('/latest-revision', root='Desenhos', folder='..', drawing='Laser') == 400)
+        check("rejected folders are not stored as clients", len(client.clients_of(['Desenhos'])) == 5)
+
+        # Refreshes keep a built index current
+        index = server.service.index
+        index.build('Desenhos')
+        client_path = index.client_path('Desenhos', folder)
+        os.makedirs(os.path.join(client_path, f"{code}-0004", 'Rev-00'))
+        open(os.path.join(client_path, f"{code}-0004", 'Rev-00', 'new-drawing.dxf'), 'w').close()
+        client.get('/refresh', root='Desenhos')
+        check("refresh indexes the files of a new drawing", index.find_files(name='new-drawing'))
+        open(os.path.join(client_path, drawing, 'Rev-00', 'saved.pdf'), 'w').close()
+        client.get('/refresh', root='Desenhos', deep=1)
+        check("deep refresh indexes a file saved into an existing Rev-xx folder",
+              index.find_files(name='saved'))
+    except (OSError, LookupError, TypeError, ValueError) as e:
+        failures.append(f"{type(e).__name__}: {e}")
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            server.service.close()
+        shutil.rmtree(base, ignore_errors=True)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the ClientFinder index to workstations")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--index', help="path of the index database")
+    parser.add_argument('--root', action='append', default=[], metavar='NAME=PATH',
+                        help="override or add a directory, e.g. Desenhos=/mnt/desenhos")
+    parser.add_argument('--refresh-interval', type=float, default=300,
+                        help="seconds between incremental refreshes (0 disables)")
+    parser.add_argument('--self-test', action='store_true',
+                        help="check the service against a generated tree on localhost and exit")
+    args = parser.parse_args(argv)
+
+    if args.self_test:
+        failures = self_test()
+        for failure in failures:
+            print(f"FAILED: {failure}")
+        print("ok" if not failures else f"{len(failures)} check(s) failed")
+        return 1 if failures else 0
+
+    directories = dict(DIRECTORIES)
+    for override in args.root:
+        name, _, path = override.partition('=')
+        directories[name] = path
+
+    server = make_server(directories, args.host, args.port, args.index)
+    if args.refresh_interval > 0:
+        start_refresh_loop(server, args.refresh_interval)
+    print(f"Serving the client index on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
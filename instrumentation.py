@@ -0,0 +1,120 @@
+"""Timing spans around user actions, appended to a JSONL log
+
+Each finished span is one line in timings.jsonl next to the index:
+
+    {"action": "on_client_select", "ms": 41.2, "fs_calls": 5, "size": 12, "time": 1760000000.0}
+
+fs_calls counts the share calls made on behalf of the span: inside
+measuring(span) on the calling thread, or by a function wrapped with
+bind(span, func) wherever it runs. Calls of other threads (prefetches,
+background indexing) are not counted. It needs the index to go through a
+share_fs.CountingFS. Recording a span costs two perf_counter() calls and
+one line write, cheap enough to leave on.
+"""
+import json
+import os
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import nullcontext
+
+from app_state import app_data_dir
+
+# Upper bounds (ms) of the histogram buckets; the last bucket is open
+HISTOGRAM_BOUNDS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# The log is rotated to timings.jsonl.1 once it grows past this size
+MAX_LOG_BYTES = 5 * 1024 * 1024
+
+
+class Span:
+    """One timed action; extra fields (sizes, errors) go into the log line"""
+
+    def __init__(self, action, **fields):
+        self.action = action
+        self.start = time.perf_counter()
+        self.calls = Counter()
+        self.fields = fields
+
+
+class Recorder:
+    """Times user actions and keeps the recent durations for the histogram"""
+
+    def __init__(self, fs=None, path=None, history=500):
+        self.fs = fs
+        self.path = path or os.path.join(app_data_dir(), 'timings.jsonl')
+        self.durations = defaultdict(lambda: deque(maxlen=history))
+        self.log = None
+
+    def start(self, action, **fields):
+        """Open a span, to be passed to finish() when the action is done"""
+        return Span(action, **fields)
+
+    def measuring(self, span):
+        """Context in which the share calls of the current thread count towards span"""
+        if self.fs is None:
+            return nullcontext()
+        return self.fs.counting(span.calls)
+
+    def bind(self, span, func):
+        """Wrap func so its share calls count towards span, in whatever thread it runs"""
+        def run(*args, **kwargs):
+            with self.measuring(span):
+                return func(*args, **kwargs)
+        return run
+
+    def finish(self, span, **fields):
+        """Close a span and log it; returns its duration in ms"""
+        ms = (time.perf_counter() - span.start) * 1000
+        self.durations[span.action].append(ms)
+        record = {'action': span.action, 'ms': round(ms, 2), 'fs_calls': sum(span.calls.values())}
+        record.update(span.fields)
+        record.update(fields)
+        record['time'] = time.time()
+        self.write(record)
+        return ms
+
+    def write(self, record):
+        try:
+            if self.log is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                # Line buffered, so the log is current even if the app is killed
+                self.log = open(self.path, 'a', encoding='utf-8', buffering=1)
+            self.log.write(json.dumps(record, ensure_ascii=False) + '\n')
+            if self.log.tell() > MAX_LOG_BYTES:
+                self.log.close()
+                self.log = None
+                os.replace(self.path, self.path + '.1')
+        except (OSError, TypeError, ValueError):
+            # Timings must never break the action they measure
+            pass
+
+    def histogram(self, action, bounds=HISTOGRAM_BOUNDS):
+        """Return (label, count) per bucket of the recent durations of an action"""
+        counts = [0] * (len(bounds) + 1)
+        for ms in self.durations.get(action, ()):
+            bucket = 0
+            while bucket < len(bounds) and ms > bounds[bucket]:
+                bucket += 1
+            counts[bucket] += 1
+        labels = [f"<= {bound} ms" for bound in bounds] + [f"> {bounds[-1]} ms"]
+        return list(zip(labels, counts))
+
+    def report(self, width=40):
+        """Text histogram of every action recorded in this session"""
+        lines = []
+        for action in sorted(self.durations):
+            durations = sorted(self.durations[action])
+            median = durations[len(durations) // 2]
+            lines.append(f"{action}  (n={len(durations)}, median {median:.1f} ms, max {durations[-1]:.1f} ms)")
+            histogram = self.histogram(action)
+            most = max(count for _label, count in histogram) or 1
+            for label, count in histogram:
+                if count:
+                    lines.append(f"  {label:>12}  {'#' * max(1, count * width // most)} {count}")
+            lines.append('')
+        return '\n'.join(lines)
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
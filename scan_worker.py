@@ -0,0 +1,204 @@
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ScanCancelled(Exception):
+    """Raised inside a scan once its token has been cancelled"""
+
+
+class ScanToken:
+    """Handle given to a running scan to check for cancellation and stream results"""
+
+    def __init__(self, worker, channel):
+        self.worker = worker
+        self.channel = channel
+        self.event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        self.event.set()
+
+    def check(self):
+        """Stop the scan if it has been cancelled"""
+        if self.event.is_set():
+            raise ScanCancelled()
+
+    def emit(self, items):
+        """Send a partial batch of results back to the Tk thread"""
+        self.check()
+        self.worker.results.put((self, 'chunk', items))
+
+
+class ScanWorker:
+    """Run filesystem listings in a thread pool and deliver results on the Tk thread
+
+    Each scan belongs to a channel (e.g. 'clients' or 'drawings'). Starting a
+    new scan on a channel cancels the previous one, and results of a cancelled
+    scan are never delivered. Tk widgets are only touched from the polling
+    callback, which runs in the Tk main loop.
+    """
+
+    def __init__(self, widget, max_workers=4, poll_ms=30):
+        self.widget = widget
+        self.poll_ms = poll_ms
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scan')
+        self.results = queue.Queue()
+        self.tokens = {}
+        self.callbacks = {}
+        self.stopped = False
+        self.poll_id = self.widget.after(self.poll_ms, self.poll)
+
+    def submit(self, channel, func, *args, on_result, on_chunk=None, on_error=None):
+        """Run func(*args, token=token) in the pool, cancelling the channel's previous scan"""
+        self.cancel(channel)
+        token = ScanToken(self, channel)
+        self.tokens[channel] = token
+        self.callbacks[token] = (on_result, on_chunk, on_error)
+        self.executor.submit(self._run, token, func, args)
+        return token
+
+    def cancel(self, channel):
+        """Cancel the running scan of a channel, if any"""
+        token = self.tokens.pop(channel, None)
+        if token is not None:
+            token.cancel()
+            self.callbacks.pop(token, None)
+
+    def _run(self, token, func, args):
+        try:
+            token.check()
+            result = func(*args, token=token)
+            self.results.put((token, 'result', result))
+        except ScanCancelled:
+            pass
+        except Exception as e:
+            self.results.put((token, 'error', e))
+
+    def poll(self):
+        """Deliver queued results to their callbacks; runs on the Tk thread"""
+        try:
+            while True:
+                try:
+                    token, kind, payload = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                callbacks = self.callbacks.get(token)
+                if token.cancelled or callbacks is None:
+                    continue
+                on_result, on_chunk, on_error = callbacks
+                if kind == 'chunk':
+                    callback = on_chunk
+                else:
+                    # The scan is finished, drop its bookkeeping
+                    self.callbacks.pop(token, None)
+                    if self.tokens.get(token.channel) is token:
+                        del self.tokens[token.channel]
+                    callback = on_result if kind == 'result' else on_error
+                if callback is None:
+                    continue
+                try:
+                    callback(payload)
+                except Exception:
+                    # A failing callback must not stop later results from arriving
+                    self.report_exception()
+        finally:
+            if not self.stopped:
+                self.poll_id = self.widget.after(self.poll_ms, self.poll)
+
+    def report_exception(self):
+        """Report the exception being handled the way Tk reports callback errors"""
+        root = self.widget._root() if hasattr(self.widget, '_root') else self.widget
+        root.report_callback_exception(*sys.exc_info())
+
+    def shutdown(self):
+        """Cancel every scan and stop the pool, e.g. when the window closes"""
+        if self.stopped:
+            return
+        self.stopped = True
+        for channel in list(self.tokens):
+            self.cancel(channel)
+        try:
+            self.widget.after_cancel(self.poll_id)
+        except Exception:
+            # The window may already be destroyed
+            pass
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class Debouncer:
+    """Delay a Tk callback until calls have stopped for delay_ms
+
+    Used on filter boxes so that only the last keystroke of a burst runs the
+    query and redraws the list.
+    """
+
+    def __init__(self, widget, delay_ms, func):
+        self.widget = widget
+        self.delay_ms = delay_ms
+        self.func = func
+        self.after_id = None
+
+    def __call__(self, *args):
+        self.cancel()
+        self.after_id = self.widget.after(self.delay_ms, self.flush)
+
+    def cancel(self):
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+
+    def flush(self):
+        """Run the pending call now"""
+        self.cancel()
+        self.func()
+
+
+class Prefetcher:
+    """Warm the index for clients the user is likely to open next
+
+    func(root, folder) is called in a small pool of its own, so prefetching
+    never delays a listing the user is waiting for. Each prefetch() call
+    supersedes the previous one: queued clients that are no longer wanted
+    are skipped, and a client is not fetched again within ttl seconds, since
+    the index then answers it with a single stat anyway.
+    """
+
+    def __init__(self, func, max_workers=2, ttl=30):
+        self.func = func
+        self.ttl = ttl
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.fetched = {}
+
+    def prefetch(self, clients):
+        """Fetch (root, folder) clients in the background, most likely first"""
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+        for client in clients:
+            self.executor.submit(self._run, generation, client)
+
+    def _run(self, generation, client):
+        now = time.monotonic()
+        with self.lock:
+            if generation != self.generation or now - self.fetched.get(client, -self.ttl) < self.ttl:
+                return
+            self.fetched[client] = now
+        try:
+            self.func(*client)
+        except Exception:
+            # Only a guess; the real selection reports its own errors
+            with self.lock:
+                self.fetched.pop(client, None)
+
+    def shutdown(self):
+        with self.lock:
+            self.generation += 1
+        self.executor.shutdown(wait=False, cancel_futures=True)
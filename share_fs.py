@@ -0,0 +1,166 @@
+"""Filesystem access used by the index, so listings can be slowed down and counted
+
+ClientIndex lists and stats the share through an object with scandir(),
+stat(), mkdir() and carry(). LocalFS passes straight through to os,
+CountingFS counts the calls (the GUIs use it for their timings) and SlowFS
+also reproduces an SMB share on a local disk, e.g. for the benchmarks:
+
+    fs = SlowFS(latency=0.004, jitter=0.002)
+    index = ClientIndex(directories, fs=fs)
+    ...
+    fs.calls  # Counter({'stat': 12, 'scandir': 3, 'scandir-page': 3})
+"""
+import os
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+class LocalFS:
+    """Direct access through os"""
+
+    def scandir(self, path):
+        return os.scandir(path)
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def mkdir(self, path):
+        os.mkdir(path)
+
+    def carry(self, func):
+        """Return func, to be run in another thread on behalf of this one"""
+        return func
+
+
+LOCAL_FS = LocalFS()
+
+
+class CountingFS:
+    """Wraps another filesystem and counts its calls by kind
+
+    calls counts them by kind; round_trips() is the total. Calls made by a
+    thread inside counting(counter) are also added to that counter, so a
+    timing span only counts the calls of the work it measures, not those of
+    prefetches or indexing running at the same time.
+    """
+
+    def __init__(self, fs=None):
+        self.fs = fs or LOCAL_FS
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        # Counters active in each thread
+        self.local = threading.local()
+
+    def active(self):
+        return getattr(self.local, 'counters', ())
+
+    def count(self, kind):
+        with self.lock:
+            self.calls[kind] += 1
+        for counter in self.active():
+            counter[kind] += 1
+
+    @contextmanager
+    def counting(self, *counters):
+        """Also count the calls of the current thread into counters while active"""
+        previous = self.active()
+        self.local.counters = previous + counters
+        try:
+            yield
+        finally:
+            self.local.counters = previous
+
+    def carry(self, func):
+        """Wrap func so its calls, in whatever thread, count like the current thread's"""
+        counters = self.active()
+        if not counters:
+            return func
+
+        def run(*args, **kwargs):
+            with self.counting(*counters):
+                return func(*args, **kwargs)
+        return run
+
+    def round_trips(self):
+        with self.lock:
+            return sum(self.calls.values())
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+
+    def scandir(self, path):
+        self.count('scandir')
+        return self.fs.scandir(path)
+
+    def stat(self, path):
+        self.count('stat')
+        return self.fs.stat(path)
+
+    def mkdir(self, path):
+        self.count('mkdir')
+        self.fs.mkdir(path)
+
+
+class SlowScandir:
+    """Iterator over scandir entries that pays one round trip per page
+
+    An SMB directory query returns entries in pages with their attributes
+    included, so entry.stat() costs nothing extra on the real share.
+    """
+
+    def __init__(self, fs, entries):
+        self.fs = fs
+        self.entries = entries
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.entries.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.count % self.fs.page_size == 0:
+            self.fs.delay('scandir-page')
+        self.count += 1
+        return next(self.entries)
+
+
+class SlowFS(CountingFS):
+    """CountingFS that also adds latency and jitter to every call
+
+    Every call sleeps latency plus a uniform random share of jitter seconds.
+    """
+
+    def __init__(self, latency=0.002, jitter=0.0, fs=None, page_size=100, seed=None):
+        super().__init__(fs)
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+        self.random = random.Random(seed)
+
+    def delay(self, kind):
+        self.count(kind)
+        with self.lock:
+            seconds = self.latency + self.random.uniform(0, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def scandir(self, path):
+        self.delay('scandir')
+        return SlowScandir(self, self.fs.scandir(path))
+
+    def stat(self, path):
+        self.delay('stat')
+        return self.fs.stat(path)
+
+    def mkdir(self, path):
+        self.delay('mkdir')
+        self.fs.mkdir(path)
@@ -0,0 +1,105 @@
+"""Detects Tk main loop stalls and records what was blocking it
+
+A heartbeat scheduled with after() should run every interval; when it runs
+late, some callback held the main loop. A monitor thread notices the stall
+while it is still happening and captures the stack of the Tk thread, so the
+report in stalls.log (next to the index) shows the blocking callback:
+
+    2026-10-18 09:12:03  stall of 1840 ms (#3)
+      File "tab_client.py", line 312, in open_last_drawing
+      ...
+
+With a profile directory, the Tk thread also runs under cProfile and each
+stall is dumped to stall-NNN.prof there (read with python -m pstats).
+"""
+import cProfile
+import os
+import sys
+import threading
+import time
+import traceback
+
+from app_state import app_data_dir
+
+
+class StallWatchdog:
+    """Measures event loop lag with an after() heartbeat and logs stalls over threshold_ms"""
+
+    def __init__(self, widget, threshold_ms=500, interval_ms=100, profile_dir=None, log_path=None):
+        self.widget = widget
+        self.threshold = threshold_ms / 1000
+        self.interval_ms = interval_ms
+        self.interval = interval_ms / 1000
+        self.log_path = log_path or os.path.join(app_data_dir(), 'stalls.log')
+        self.profile_dir = profile_dir
+        self.stalls = 0
+
+        # Must be created on the Tk thread, which is the one watched
+        self.tk_thread_id = threading.get_ident()
+        self.lock = threading.Lock()
+        self.last_beat = time.perf_counter()
+        self.stack = None
+        self.stopped = threading.Event()
+
+        self.profiler = None
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        self.after_id = widget.after(interval_ms, self.beat)
+        threading.Thread(target=self.monitor, name='stall-watchdog', daemon=True).start()
+
+    def beat(self):
+        """Heartbeat on the Tk thread; a late one ends a stall"""
+        now = time.perf_counter()
+        with self.lock:
+            lag = now - self.last_beat - self.interval
+            stack, self.stack = self.stack, None
+            self.last_beat = now
+        if lag > self.threshold:
+            self.report(lag, stack)
+        elif self.profiler is not None:
+            # Only the time around a stall is worth keeping
+            self.profiler.clear()
+        self.after_id = self.widget.after(self.interval_ms, self.beat)
+
+    def monitor(self):
+        """Capture the Tk thread's stack once the heartbeat is late by more than the threshold"""
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                late = time.perf_counter() - self.last_beat - self.interval > self.threshold
+                if not late or self.stack is not None:
+                    continue
+                frame = sys._current_frames().get(self.tk_thread_id)
+                if frame is not None:
+                    self.stack = ''.join(traceback.format_stack(frame))
+
+    def report(self, lag, stack):
+        self.stalls += 1
+        lines = [f"{time.strftime('%Y-%m-%d %H:%M:%S')}  stall of {lag * 1000:.0f} ms (#{self.stalls})"]
+        if stack:
+            lines.append(stack.rstrip('\n'))
+        if self.profiler is not None:
+            self.profiler.disable()
+            path = os.path.join(self.profile_dir, f"stall-{self.stalls:03d}.prof")
+            self.profiler.dump_stats(path)
+            self.profiler.clear()
+            self.profiler.enable()
+            lines.append(f"  profile: {path}")
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n\n')
+        except OSError:
+            pass
+
+    def stop(self):
+        self.stopped.set()
+        try:
+            self.widget.after_cancel(self.after_id)
+        except Exception:
+            # The window may already be destroyed
+            pass
+        if self.profiler is not None:
+            self.profiler.disable()
@@ -1,12 +1,31 @@
 import os
-import re
 import sys
-import subprocess
 import tkinter as tk
-from tkinter import messagebox, ttk, simpledialog
-from unidecode import unidecode
+from tkinter import messagebox, ttk
+from app_state import load_state, save_state
+from client_index import (DIRECTORIES, CODE_QUERY_PATTERN, CODED_ROOTS, ClientIndex, CodeIndex,
+                          DRAWING_QUERY_PATTERN, DrawingMap, parse_client_folder,
+                          recent_subdirs)
+from client_search import ClientSearchIndex, FilterEngine, normalize
+from instrumentation import Recorder
+from scan_worker import Debouncer, Prefetcher, ScanWorker
+from share_fs import CountingFS
+from usage_history import SELECT_SETTLE_MS, UsageHistory
+from virtual_list import VirtualList
 
 class ClientTab:
+    # Recent drawing folders shown per client, and per "Carregar mais"
+    recent_window = 10
+
+    # Seconds a listing of a client's drawing folders is trusted for their
+    # mtimes; prefetched listings are reused within this window
+    recent_max_age = 10
+
+    # Clients listed ahead of time: on each side of the selection, and the
+    # first matches of a search
+    prefetch_neighbours = 2
+    prefetch_matches = 3
+
     def __init__(self, parent):
         self.parent = parent
 
@@ -23,17 +42,17 @@ class ClientTab:
         self.dir_label.pack(pady=(10, 0))
 
         # Predefined directories
-        self.directories = {
-            'Desenhos': r'\\192.168.1.252\Desenhos',
-            'Laser': r'\\192.168.1.252\Engenharia 1\Laser\\'
-        }
+        self.directories = dict(DIRECTORIES)
+
+        # Pseudo-directory that searches every predefined directory at once
+        self.all_directories = 'Todos'
 
         # Directory Combobox
         self.selected_dir = tk.StringVar()
         self.dir_combo = ttk.Combobox(
             self.left_frame, 
             textvariable=self.selected_dir, 
-            values=list(self.directories.keys()),
+            values=list(self.directories.keys()) + [self.all_directories],
             state="readonly",
             width=50
         )
@@ -41,6 +60,50 @@ class ClientTab:
         self.dir_combo.set("Selecione um diretório")
         self.dir_combo.bind("<<ComboboxSelected>>", self.on_directory_select)
 
+        # Bring the index of the selected directory up to date, listing only
+        # the folders whose mtime changed
+        self.refresh_btn = tk.Button(
+            self.left_frame,
+            text="Atualizar",
+            command=self.refresh_client_list
+        )
+        self.refresh_btn.pack(pady=(0, 5))
+
+        # Local index of clients and drawings, so browsing avoids NAS round trips.
+        # With CLIENTFINDER_SERVER set, a shared index service answers instead.
+        self.index = self.open_index()
+
+        # Timings of every action, logged as JSONL; F12 shows their histogram
+        self.timings = Recorder(getattr(self.index, 'fs', None))
+        self.parent.winfo_toplevel().bind('<F12>', self.show_timings, add='+')
+
+        # Listings run off the Tk thread so a slow NAS never freezes the window
+        self.worker = ScanWorker(self.parent)
+
+        # Lists likely next clients in the background, so moving through the
+        # list with the arrow keys finds their drawings freshly listed
+        self.prefetcher = Prefetcher(self.list_drawings, ttl=self.recent_max_age)
+
+        # Clients this user selects and opens most, listed first. A selection
+        # counts once it settles, not for each client passed with the arrow keys.
+        self.usage = UsageHistory()
+        self.select_debouncer = Debouncer(self.parent, SELECT_SETTLE_MS, self.record_selection)
+
+        # (directory, client) records of the selected directory, searched in
+        # memory on every keystroke, and the records currently listed. While
+        # a stored snapshot is shown and its filter is still being built,
+        # client_filter is None and snapshot_records are searched directly.
+        self.client_filter = FilterEngine([])
+        self.snapshot_records = []
+
+        # Client code -> records, for code queries and duplicate codes
+        self.code_index = CodeIndex([])
+        self.shown_clients = []
+        self.current_client = None
+
+        # Drawing number -> client folder, for jumping straight to a drawing
+        self.drawing_map = DrawingMap([])
+
         # Filter input for clients
         self.filter_label = tk.Label(self.left_frame, text="Pesquisar:")
         self.filter_label.pack(pady=(10, 0))
@@ -48,31 +111,21 @@ class ClientTab:
         self.filter_var = tk.StringVar()
         self.filter_entry = tk.Entry(self.left_frame, textvariable=self.filter_var, width=50)
         self.filter_entry.pack(pady=5)
-        self.filter_var.trace('w', self.update_client_list)
+        # Only the last keystroke of a burst filters and redraws the list
+        self.filter_debouncer = Debouncer(self.parent, 120, self.update_client_list)
+        self.filter_var.trace('w', self.filter_debouncer)
 
         # Client Listbox with Scrollbar
         self.client_label = tk.Label(self.left_frame, text="Clientes:")
         self.client_label.pack(pady=(10, 0))
 
-        # Create a frame to hold listbox and scrollbar
+        # Create a frame to hold the client list
         self.client_listbox_frame = tk.Frame(self.left_frame)
         self.client_listbox_frame.pack(pady=5, expand=True, fill=tk.BOTH)
 
-        # Scrollbar
-        self.client_scrollbar = tk.Scrollbar(self.client_listbox_frame)
-        self.client_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-
-        # Listbox with scrollbar
-        self.client_listbox = tk.Listbox(
-            self.client_listbox_frame, 
-            width=70, 
-            height=20, 
-            yscrollcommand=self.client_scrollbar.set
-        )
-        self.client_listbox.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
-
-        # Configure scrollbar
-        self.client_scrollbar.config(command=self.client_listbox.yview)
+        # Virtual list with its own scrollbar; only the visible rows are rendered
+        self.client_listbox = VirtualList(self.client_listbox_frame, width=70, height=20)
+        self.client_listbox.pack(expand=True, fill=tk.BOTH)
 
         # Bind selection event
         self.client_listbox.bind('<<ListboxSelect>>', self.on_client_select)
@@ -100,42 +153,244 @@ class ClientTab:
             state=tk.DISABLED
         )
         self.open_folder_btn.pack(side=tk.RIGHT)
+
+        # Show the next window of older drawing folders
+        self.load_more_btn = tk.Button(
+            self.buttons_frame,
+            text="Carregar mais",
+            command=self.show_more_drawings,
+            state=tk.DISABLED
+        )
+        self.load_more_btn.pack(side=tk.LEFT)
+
+        # Subfolders of the selected client and how many of them are listed
+        self.client_subdirs = []
+        self.shown_drawings = 0
+
+        # Stop the background listings with the tab, so closing the window
+        # does not wait for them
+        self.main_frame.bind('<Destroy>', self.close)
+
+        # Reopen the last used directory, showing its stored client list at once
+        self.state = load_state()
+        last_dir = self.state.get('ClientTab.directory')
+        if last_dir in self.directories or last_dir == self.all_directories:
+            self.dir_combo.set(last_dir)
+            self.on_directory_select()
     
+    def open_index(self):
+        """Return the index service client if CLIENTFINDER_SERVER is set, else the local index"""
+        if os.environ.get('CLIENTFINDER_SERVER'):
+            # Imported only when used; http and urllib are slow to import
+            from index_server import IndexServiceClient
+            return IndexServiceClient.from_env(self.directories)
+        return ClientIndex(self.directories, fs=CountingFS())
+
     def on_directory_select(self, event=None):
         """Handle directory selection and load all clients"""
-        selected_dir_name = self.selected_dir.get()
-        if selected_dir_name in self.directories:
+        if self.selected_roots():
+            # Drop drawings of the previous directory and any listing still
+            # running; a late client list or drawing map of it must not land
+            # on this one
+            self.worker.cancel('drawings')
+            self.worker.cancel('clients')
+            self.worker.cancel('drawing-map')
+            self.drawing_listbox.delete(0, tk.END)
+            self.open_folder_btn.config(state=tk.DISABLED)
+            self.load_more_btn.config(state=tk.DISABLED)
+            self.current_client = None
+            self.select_debouncer.cancel()
+            self.client_filter = FilterEngine([])
+            self.code_index = CodeIndex([])
+            self.drawing_map = DrawingMap([])
             # Clear the search filter when changing directories
             self.filter_var.set("")
-            # Update client list with empty filter to show all
-            self.update_client_list()
+            self.filter_debouncer.cancel()
+            # Remember the directory for the next start
+            self.state['ClientTab.directory'] = self.selected_dir.get()
+            save_state(self.state)
+            # Load the clients of the directory, shown with an empty filter
+            self.load_clients()
+
+    def selected_roots(self):
+        """Return the predefined directories covered by the combobox selection"""
+        selected_dir_name = self.selected_dir.get()
+        if selected_dir_name == self.all_directories:
+            return list(self.directories)
+        if selected_dir_name in self.directories:
+            return [selected_dir_name]
+        return []
     
+    def refresh_client_list(self):
+        """Update the index of the selected directory incrementally and reload it"""
+        self.load_clients(refresh=True)
+
+    def load_clients(self, refresh=False):
+        """Load the client list of the selected directory into the search index"""
+        roots = self.selected_roots()
+        if not roots:
+            return
+
+        selected_dir_path = ', '.join(self.directories[root] for root in roots)
+        self.worker.cancel('revalidate')
+        span = self.timings.start('load_clients', directory=self.selected_dir.get(), refresh=refresh)
+
+        # Stale-while-revalidate: a directory listed before is shown straight
+        # from the index and checked against the share in the background
+        snapshot = None if refresh else self.index.snapshot(roots)
+        if snapshot is not None:
+            self.show_snapshot(roots, snapshot, selected_dir_path)
+            self.timings.finish(span, size=len(snapshot), source='snapshot')
+            return
+
+        self.client_listbox.clear()
+        self.shown_clients = []
+
+        # Client folders come from the local index; the share is only listed
+        # the first time a directory is used or on refresh. All directories
+        # are listed concurrently, and partial listings of a single directory
+        # are shown while they arrive.
+        self.worker.submit(
+            'clients', self.timings.bind(span, self.build_client_search), roots, refresh,
+            on_result=lambda client_search: self.show_clients(client_search, span),
+            on_chunk=(lambda batch: self.append_clients(roots[0], batch)) if len(roots) == 1 else None,
+            on_error=lambda e: self.show_directory_error(e, selected_dir_path, span)
+        )
+
+    def show_snapshot(self, roots, rows, selected_dir_path):
+        """Show the stored client list now; build its filter and revalidate it in the background"""
+        self.client_filter = None
+        self.snapshot_records = self.client_records(rows)
+        self.update_client_list()
+
+        self.worker.submit(
+            'clients', self.make_client_search, self.snapshot_records,
+            on_result=self.show_clients
+        )
+        self.worker.submit(
+            'revalidate', self.revalidate_clients, roots, self.snapshot_records,
+            on_result=self.apply_revalidated,
+            on_error=lambda e: self.show_directory_error(e, selected_dir_path)
+        )
+
+    def revalidate_clients(self, roots, records, token=None):
+        """Return the client search of the current share listing, or None if it matches records"""
+        current = self.client_records(self.index.revalidate(roots, token=token))
+        if current == records:
+            return None
+        return self.make_client_search(current)
+
+    def apply_revalidated(self, client_search):
+        """Swap in a changed client list, keeping the filter text and the selected client"""
+        if client_search is None:
+            return
+        self.worker.cancel('clients')
+        self.show_clients(client_search)
+
+    def client_records(self, rows):
+        """(directory, client) records of index rows, most used first, then by client folder"""
+        # Sorted once per load; the filter keeps this order, so the ranking
+        # costs nothing per keystroke
+        score = self.usage.score
+        records = sorted((-score(row[0], row[1]), row[1], row[0]) for row in rows)
+        return [(root, folder) for _score, folder, root in records]
+
+    @staticmethod
+    def make_client_search(records, token=None):
+        """Return the (client filter, code index) pair of records"""
+        codes = []
+        for record in records:
+            parsed = parse_client_folder(record[1], record[0] in CODED_ROOTS)
+            if parsed and parsed[0]:
+                codes.append((parsed[0], record))
+        return FilterEngine(records, key=lambda record: record[1]), CodeIndex(codes)
+
+    def build_client_search(self, roots, refresh, token=None):
+        """Build the client search of the directories; runs in the scan worker"""
+        rows = self.index.clients_of(roots, refresh=refresh, token=token)
+        return self.make_client_search(self.client_records(rows))
+
+    def show_clients(self, client_search, span=None):
+        """Install a freshly loaded client search and show the filtered clients"""
+        selection = self.client_listbox.curselection()
+        selected = self.shown_clients[selection[0]] if selection else None
+        self.client_filter, self.code_index = client_search
+        self.update_client_list()
+        if selected in self.shown_clients:
+            self.client_listbox.select(self.shown_clients.index(selected))
+        if span is not None:
+            self.timings.finish(span, size=len(self.client_filter), source='share')
+
+        # Map every drawing number to its client in the background
+        self.worker.submit(
+            'drawing-map', self.index.drawing_map, self.selected_roots(),
+            on_result=self.load_drawing_map
+        )
+
+    def load_drawing_map(self, drawing_map):
+        """Install the drawing number map, refreshing a drawing search in progress"""
+        self.drawing_map = drawing_map
+        if DRAWING_QUERY_PATTERN.match(self.filter_var.get().strip()):
+            self.update_client_list()
+
+    def append_clients(self, root, batch):
+        """Show a partial batch of client folders while the listing is running"""
+        search_text = self.filter_var.get()
+        records = [(root, client) for client in
+                   ClientSearchIndex(name for name, _mtime in batch).matches(search_text)]
+        self.shown_clients.extend(records)
+        self.client_listbox.append_items(self.client_label(record) for record in records)
+
+    def client_label(self, record):
+        """Listbox text of a client, tagged with its directory when searching all of them"""
+        root, client = record[:2]
+        label = client
+        if len(record) > 2:
+            # (directory, client, drawing) found by drawing number
+            label = f"{record[2]}  ({client})"
+        elif record in self.code_index.flagged:
+            label = f"{label}  (código duplicado)"
+        if self.selected_dir.get() == self.all_directories:
+            return f"{label}  [{root}]"
+        return label
+
     def update_client_list(self, *args):
         """Update the client list based on the filter text"""
-        search_text = self.filter_var.get().lower()
-        
-        # Get the selected directory
-        selected_dir_name = self.selected_dir.get()
-        if selected_dir_name not in self.directories:
-            return
-            
-        selected_dir_path = self.directories[selected_dir_name]
-        
-        # Clear current list
-        self.client_listbox.delete(0, tk.END)
-        
-        try:
-            if os.path.exists(selected_dir_path):
-                client_dirs = [d for d in os.listdir(selected_dir_path) 
-                              if os.path.isdir(os.path.join(selected_dir_path, d))
-                              and search_text in unidecode(d.lower())]
-                
-                for client in sorted(client_dirs):
-                    self.client_listbox.insert(tk.END, client)
-            else:
-                messagebox.showwarning("Caminho Não Encontrado", f"O caminho {selected_dir_path} não existe.")
-        except Exception as e:
-            messagebox.showerror("Erro", f"Erro ao acessar o diretório: {str(e)}")
+        self.filter_debouncer.cancel()
+        span = self.timings.start('update_client_list')
+
+        # Pure in-memory query, the share is never listed here. A full or
+        # partial drawing number (110-0110, 110-01) lists the matching drawings
+        # themselves, and 1 to 3 digits list the clients whose code starts
+        # with them. When nothing contains the text, the closest names are
+        # shown instead (typos).
+        query = self.filter_var.get().strip()
+        code_matches = self.code_index.prefix(query) if CODE_QUERY_PATTERN.match(query) else None
+        if DRAWING_QUERY_PATTERN.match(query):
+            self.shown_clients = [(root, folder, drawing)
+                                  for drawing, root, folder in self.drawing_map.lookup(query)]
+        elif code_matches:
+            self.shown_clients = code_matches
+        elif self.client_filter is None:
+            # Snapshot shown while its filter is still being built
+            key = normalize(query)
+            self.shown_clients = [record for record in self.snapshot_records
+                                  if key in normalize(record[1])]
+        else:
+            self.shown_clients = self.client_filter.ranked_filter(query)
+        self.client_listbox.set_items(self.client_label(record) for record in self.shown_clients)
+        self.timings.finish(span, size=len(self.shown_clients), query_length=len(query))
+        if query:
+            self.prefetcher.prefetch([record[:2] for record in self.shown_clients[:self.prefetch_matches]])
+
+    def show_directory_error(self, error, selected_dir_path, span=None):
+        """Report a failed client listing"""
+        if span is not None:
+            self.timings.finish(span, error=type(error).__name__)
+        if isinstance(error, FileNotFoundError):
+            messagebox.showwarning("Caminho Não Encontrado", f"O caminho {selected_dir_path} não existe.")
+        else:
+            messagebox.showerror("Erro", f"Erro ao acessar o diretório: {str(error)}")
     
     def on_client_select(self, event):
         """Handle client selection from the listbox"""
@@ -143,40 +398,116 @@ class ClientTab:
         if not selection:
             return
             
-        client = self.client_listbox.get(selection[0])
-        selected_dir_name = self.selected_dir.get()
-        selected_dir_path = self.directories[selected_dir_name]
+        record = self.shown_clients[selection[0]]
+        self.current_client = record[:2]
+        self.select_debouncer()
         
-        # Full path to client directory
-        client_path = os.path.join(selected_dir_path, client)
-        
-        # Display client directory in drawing listbox
-        self.populate_drawing_listbox(client_path)
+        if len(record) > 2:
+            # Jump straight to the drawing found by number
+            self.show_drawing(*record)
+        else:
+            # Display client directory in drawing listbox
+            self.populate_drawing_listbox(*self.current_client)
+        self.prefetch_neighbours_of(selection[0])
+
+    def record_selection(self):
+        """Count the selected client as used, once the selection has settled"""
+        if self.current_client is not None:
+            self.usage.record(*self.current_client, 'select')
+
+    def prefetch_neighbours_of(self, index):
+        """Prefetch the clients around a list position, nearest first"""
+        positions = []
+        for distance in range(1, self.prefetch_neighbours + 1):
+            positions.extend((index + distance, index - distance))
+        self.prefetcher.prefetch([self.shown_clients[position][:2] for position in positions
+                                  if 0 <= position < len(self.shown_clients)])
+
+    def show_drawing(self, root, client, drawing):
+        """Show a drawing and its latest Rev-xx folder, selecting the latter"""
+        self.drawing_listbox.delete(0, tk.END)
+        self.open_folder_btn.config(state=tk.DISABLED)
+        self.load_more_btn.config(state=tk.DISABLED)
+        span = self.timings.start('show_drawing')
+
+        def show_revision(rev):
+            self.drawing_listbox.delete(0, tk.END)
+            self.drawing_listbox.insert(tk.END, drawing)
+            if rev:
+                self.drawing_listbox.insert(tk.END, os.path.join(drawing, rev))
+            self.drawing_listbox.selection_set(tk.END)
+            self.open_folder_btn.config(state=tk.NORMAL)
+            self.timings.finish(span)
+
+        def show_error(error):
+            self.timings.finish(span, error=type(error).__name__)
+            messagebox.showerror("Erro", f"Erro ao ler o diretório do desenho: {str(error)}")
+
+        self.worker.submit(
+            'drawings', self.timings.bind(span, self.index.latest_revision), root, client, drawing,
+            on_result=show_revision,
+            on_error=show_error
+        )
     
-    def populate_drawing_listbox(self, client_path):
+    def populate_drawing_listbox(self, root, client):
         """Populate the drawing listbox with the latest files/folders"""
         self.drawing_listbox.delete(0, tk.END)
+        self.open_folder_btn.config(state=tk.DISABLED)
+        self.load_more_btn.config(state=tk.DISABLED)
         
-        try:
-            # Get all subdirectories
-            subdirs = [d for d in os.listdir(client_path) 
-                      if os.path.isdir(os.path.join(client_path, d))]
-            
-            # Sort by modification time (newest first)
-            subdirs.sort(key=lambda x: os.path.getmtime(os.path.join(client_path, x)), 
-                        reverse=True)
-            
-            # Add to listbox
-            for subdir in subdirs[:10]:  # Show top 10 recent dirs
-                self.drawing_listbox.insert(tk.END, subdir)
-                
-            if subdirs:
-                self.open_folder_btn.config(state=tk.NORMAL)
-            else:
-                self.open_folder_btn.config(state=tk.DISABLED)
-                
-        except Exception as e:
-            messagebox.showerror("Erro", f"Erro ao ler o diretório do cliente: {str(e)}")
+        span = self.timings.start('populate_drawing_listbox')
+
+        def show_error(error):
+            self.timings.finish(span, error=type(error).__name__)
+            messagebox.showerror("Erro", f"Erro ao ler o diretório do cliente: {str(error)}")
+
+        # Get all subdirectories with their modification times in the background;
+        # selecting another client cancels this listing
+        self.worker.submit(
+            'drawings', self.timings.bind(span, self.list_drawings), root, client,
+            on_result=lambda subdirs: self.show_drawings(subdirs, span),
+            on_error=show_error
+        )
+
+    def list_drawings(self, root, client, token=None):
+        """Return the (name, mtime) subfolders of a client with current mtimes
+
+        A new Rev-xx folder changes its drawing's mtime but not the client
+        folder's, so the stored listing is not enough to rank by recency:
+        the client folder is listed again (a single scandir) unless it was
+        listed in the last recent_max_age seconds.
+        """
+        return self.index.subdirs(root, client, token, max_age=self.recent_max_age)
+
+    def show_drawings(self, subdirs, span=None):
+        """Show the most recently modified subdirectories of the client"""
+        self.drawing_listbox.delete(0, tk.END)
+        self.client_subdirs = subdirs
+        self.shown_drawings = 0
+        self.show_more_drawings()
+        if span is not None:
+            self.timings.finish(span, size=len(subdirs))
+
+        if subdirs:
+            self.open_folder_btn.config(state=tk.NORMAL)
+        else:
+            self.open_folder_btn.config(state=tk.DISABLED)
+
+    def show_more_drawings(self):
+        """Append the next window of subdirectories, newest first"""
+        # Only the newest shown + window folders are selected from the listing
+        # (with current mtimes, see list_drawings), so a client with thousands
+        # of drawings opens as fast as a small one
+        count = self.shown_drawings + self.recent_window
+        recent = recent_subdirs(self.client_subdirs, count)
+        for subdir, _mtime in recent[self.shown_drawings:]:
+            self.drawing_listbox.insert(tk.END, subdir)
+        self.shown_drawings = len(recent)
+
+        if self.shown_drawings < len(self.client_subdirs):
+            self.load_more_btn.config(state=tk.NORMAL)
+        else:
+            self.load_more_btn.config(state=tk.DISABLED)
     
     def open_last_drawing(self):
         """Open the selected drawing directory"""
@@ -186,15 +517,16 @@ class ClientTab:
             return
             
         drawing = self.drawing_listbox.get(selection[0])
-        client = self.client_listbox.get(self.client_listbox.curselection()[0])
-        selected_dir_name = self.selected_dir.get()
-        selected_dir_path = self.directories[selected_dir_name]
+        root, client = self.current_client
+        span = self.timings.start('open_last_drawing')
+        self.usage.record(root, client, 'open')
         
         # Full path to drawing directory
-        drawing_path = os.path.join(selected_dir_path, client, drawing)
+        drawing_path = os.path.join(self.index.client_path(root, client), drawing)
         
         try:
             if os.path.exists(drawing_path):
+                import subprocess
                 if sys.platform == 'win32':
                     subprocess.run(['explorer', drawing_path])
                 elif sys.platform == 'darwin':  # macOS
@@ -205,3 +537,19 @@ class ClientTab:
                 messagebox.showwarning("Caminho Não Encontrado", f"O caminho {drawing_path} não existe.")
         except Exception as e:
             messagebox.showerror("Erro", f"Erro ao abrir o diretório: {str(e)}")
+        finally:
+            self.timings.finish(span)
+
+    def close(self, event=None):
+        """Cancel the scans and prefetches still queued or running"""
+        self.worker.shutdown()
+        self.prefetcher.shutdown()
+
+    def show_timings(self, event=None):
+        """Show the response time histogram of this session"""
+        window = tk.Toplevel(self.parent)
+        window.title("Tempos de Resposta")
+        text = tk.Text(window, width=80, height=30, font='TkFixedFont')
+        text.pack(expand=True, fill=tk.BOTH)
+        text.insert(tk.END, self.timings.report() or "Nenhuma ação registrada ainda.")
+        text.config(state=tk.DISABLED)
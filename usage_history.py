@@ -0,0 +1,87 @@
+"""Local history of the clients a user works with, ranked by frecency
+
+Selecting a client, opening its last drawing and creating a drawing are
+recorded with their time in usage.json next to the index. A selection only
+counts once it has settled for SELECT_SETTLE_MS, so the clients passed
+over with the arrow keys are not counted. Each event is worth its kind's
+weight, halved every HALF_LIFE_DAYS, and a client's frecency is the sum
+over its recent events. Scores are computed when the history is loaded and
+updated per event, so sorting a client list by them costs one dict lookup
+per client when the list is loaded and nothing per keystroke.
+
+Events are written SAVE_DELAY seconds after the first unsaved one, in a
+background thread, and at exit, so recording never writes on the Tk thread.
+"""
+import atexit
+import os
+import threading
+import time
+
+from app_state import app_data_dir, load_state, save_state
+
+WEIGHTS = {'select': 1.0, 'open': 4.0, 'create': 4.0}
+HALF_LIFE_DAYS = 14
+
+# Only the most recent events of each client are kept
+MAX_EVENTS = 30
+
+# A selected client counts as used once it stays selected this long
+SELECT_SETTLE_MS = 1500
+
+# Seconds between the first unsaved event and writing the history
+SAVE_DELAY = 5
+
+
+class UsageHistory:
+    """(root, folder) -> recent (time, kind) events and their frecency score"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(app_data_dir(), 'usage.json')
+        self.events = {}
+        self.scores = {}
+        self.lock = threading.Lock()
+        # Held while writing, so writes land in the order their data was taken
+        self.save_lock = threading.Lock()
+        self.save_timer = None
+        state = load_state(self.path)
+        clients = state.get('clients', {}) if isinstance(state, dict) else {}
+        now = time.time()
+        for key, events in clients.items():
+            root, _, folder = key.partition('|')
+            self.events[(root, folder)] = [(when, kind) for when, kind in events if kind in WEIGHTS]
+            self.scores[(root, folder)] = self.frecency(self.events[(root, folder)], now)
+        # Events still waiting for the save timer are written at exit
+        atexit.register(self.save)
+
+    @staticmethod
+    def frecency(events, now):
+        half_life = HALF_LIFE_DAYS * 86400
+        return sum(WEIGHTS[kind] * 0.5 ** (max(0, now - when) / half_life) for when, kind in events)
+
+    def record(self, root, folder, kind):
+        """Record a select, open or create event of a client; it is saved shortly after"""
+        now = time.time()
+        key = (root, folder)
+        with self.lock:
+            events = self.events.setdefault(key, [])
+            events.append((now, kind))
+            del events[:-MAX_EVENTS]
+            self.scores[key] = self.frecency(events, now)
+            if self.save_timer is None:
+                self.save_timer = threading.Timer(SAVE_DELAY, self.save)
+                self.save_timer.daemon = True
+                self.save_timer.start()
+
+    def score(self, root, folder):
+        return self.scores.get((root, folder), 0.0)
+
+    def save(self):
+        """Write unsaved events now; runs on the save timer and at exit"""
+        with self.save_lock:
+            with self.lock:
+                if self.save_timer is None:
+                    return
+                self.save_timer.cancel()
+                self.save_timer = None
+                clients = {f"{root}|{folder}": list(events) for (root, folder), events in self.events.items()}
+            save_state({'clients': clients}, self.path)
@@ -0,0 +1,167 @@
+import tkinter as tk
+from tkinter import font as tkfont
+
+
+class VirtualList(tk.Frame):
+    """Listbox with a scrollbar that only renders the rows currently visible
+
+    The items live in a plain Python list; the inner tk.Listbox only ever
+    holds one screen of rows, so replacing or appending thousands of items
+    costs O(visible rows) in Tk calls. Indices given to and returned by
+    curselection() and get() are positions in the full item list.
+    """
+
+    def __init__(self, master, width=70, height=20, **kwargs):
+        super().__init__(master)
+        self.items = []
+        self.first = 0
+        self.visible = height
+        self.selected = None
+        self.rendered = None
+
+        self.scrollbar = tk.Scrollbar(self, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.listbox = tk.Listbox(
+            self,
+            width=width,
+            height=height,
+            exportselection=False,
+            activestyle='none',
+            **kwargs
+        )
+        self.listbox.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
+        self.line_height = tkfont.Font(font=self.listbox['font']).metrics('linespace') + 1
+
+        self.listbox.bind('<<ListboxSelect>>', self.on_select)
+        self.listbox.bind('<Configure>', self.on_configure)
+        self.listbox.bind('<MouseWheel>', self.on_mousewheel)
+        self.listbox.bind('<Button-4>', lambda e: self.scroll(-3))
+        self.listbox.bind('<Button-5>', lambda e: self.scroll(3))
+        for sequence, step in (('<Up>', -1), ('<Down>', 1), ('<Prior>', 'page-up'),
+                               ('<Next>', 'page-down'), ('<Home>', 'home'), ('<End>', 'end')):
+            self.listbox.bind(sequence, lambda e, step=step: self.move_selection(step))
+
+    # Data
+
+    def set_items(self, items):
+        """Replace every item with a single redraw of the visible window"""
+        self.items = list(items)
+        self.first = 0
+        self.selected = None
+        self.render()
+
+    def append_items(self, items):
+        """Append items; the window is only redrawn if they would be visible"""
+        start = len(self.items)
+        self.items.extend(items)
+        if start < self.first + self.visible:
+            self.render()
+        else:
+            self.update_scrollbar()
+
+    def clear(self):
+        self.set_items([])
+
+    def size(self):
+        return len(self.items)
+
+    def get(self, index):
+        return self.items[index]
+
+    def curselection(self):
+        return () if self.selected is None else (self.selected,)
+
+    def bind(self, sequence=None, func=None, add=None):
+        """Bind events on the inner listbox, where clicks and keys arrive"""
+        return self.listbox.bind(sequence, func, '+' if add is None else add)
+
+    # Rendering
+
+    def render(self):
+        """Show items[first:first + visible] in the listbox, skipping unchanged windows"""
+        last_first = max(0, len(self.items) - self.visible)
+        self.first = max(0, min(self.first, last_first))
+        window = self.items[self.first:self.first + self.visible + 1]
+        if window != self.rendered:
+            self.listbox.delete(0, tk.END)
+            if window:
+                self.listbox.insert(tk.END, *window)
+            self.rendered = window
+        self.listbox.selection_clear(0, tk.END)
+        if self.selected is not None and self.first <= self.selected < self.first + len(window):
+            self.listbox.selection_set(self.selected - self.first)
+            self.listbox.activate(self.selected - self.first)
+        self.update_scrollbar()
+
+    def update_scrollbar(self):
+        total = len(self.items)
+        if total <= self.visible:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.first / total, (self.first + self.visible) / total)
+
+    def see(self, index):
+        """Scroll so that items[index] is visible"""
+        if index < self.first:
+            self.first = index
+        elif index >= self.first + self.visible:
+            self.first = index - self.visible + 1
+        self.render()
+
+    def select(self, index):
+        """Select items[index] and scroll to it, without generating <<ListboxSelect>>"""
+        self.selected = index
+        self.see(index)
+
+    def scroll(self, rows):
+        self.first += rows
+        self.render()
+        return 'break'
+
+    def yview(self, *args):
+        """Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'|'pages')"""
+        if args[0] == 'moveto':
+            self.first = int(float(args[1]) * len(self.items))
+            self.render()
+        elif args[0] == 'scroll':
+            rows = int(args[1])
+            if args[2] == 'pages':
+                rows *= max(1, self.visible - 1)
+            self.scroll(rows)
+
+    # Events
+
+    def on_configure(self, event):
+        visible = max(1, event.height // self.line_height)
+        if visible != self.visible:
+            self.visible = visible
+            self.render()
+
+    def on_mousewheel(self, event):
+        return self.scroll(-3 if event.delta > 0 else 3)
+
+    def on_select(self, event):
+        selection = self.listbox.curselection()
+        if selection:
+            self.selected = self.first + selection[0]
+
+    def move_selection(self, step):
+        """Keyboard navigation over the full item list, scrolling the window as needed"""
+        if not self.items:
+            return 'break'
+        current = self.first if self.selected is None else self.selected
+        if step == 'page-up':
+            index = current - self.visible
+        elif step == 'page-down':
+            index = current + self.visible
+        elif step == 'home':
+            index = 0
+        elif step == 'end':
+            index = len(self.items) - 1
+        else:
+            index = current + step
+        self.selected = max(0, min(index, len(self.items) - 1))
+        self.see(self.selected)
+        self.listbox.event_generate('<<ListboxSelect>>')
+        return 'break'